@@ -0,0 +1,93 @@
+"""
+Compares the JSON codecs available to the bootstrap on representative
+payloads: a DynamoDB stream batch with Decimal attributes, an API Gateway
+style response and a list of records with datetime and UUID values.
+
+    python3 benchmarks/json_codec.py [--number N]
+"""
+
+import argparse
+import datetime
+import decimal
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bootstrap  # noqa: E402
+
+
+def dynamodb_stream_batch(records=100):
+    return {'Records': [{
+        'eventID': str(i),
+        'eventName': 'MODIFY',
+        'dynamodb': {
+            'Keys': {'id': decimal.Decimal(i)},
+            'NewImage': {
+                'id': decimal.Decimal(i),
+                'price': decimal.Decimal('19.99'),
+                'quantity': decimal.Decimal(3),
+                'ratio': decimal.Decimal('0.3333333333'),
+                'name': 'item-{}'.format(i),
+                'tags': ['a', 'b', 'c'],
+            },
+            'SizeBytes': decimal.Decimal(128),
+        },
+    } for i in range(records)]}
+
+
+def api_gateway_response():
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'X-Request-Id': 'abc'},
+        'body': '{"message": "Hello, the current time is 06:45:49.174383"}',
+    }
+
+
+def typed_records(records=100):
+    now = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    return [{
+        'id': uuid.UUID(int=i),
+        'created': now + datetime.timedelta(seconds=i),
+        'day': now.date(),
+        'score': i * 1.5,
+        'label': 'record-{}'.format(i),
+    } for i in range(records)]
+
+
+PAYLOADS = [
+    ('dynamodb_stream_batch', dynamodb_stream_batch()),
+    ('api_gateway_response', api_gateway_response()),
+    ('typed_records', typed_records()),
+]
+
+
+def available_codecs():
+    codecs = [bootstrap.StdlibJsonCodec()]
+    try:
+        codecs.append(bootstrap.make_json_codec('orjson'))
+    except (ImportError, AttributeError) as e:
+        print('orjson codec not available: {}'.format(e))
+    return codecs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help='iterations per measurement')
+    args = parser.parse_args()
+
+    codecs = available_codecs()
+    print('{:<24} {:<8} {:>12} {:>12} {:>10}'.format('payload', 'codec', 'encode us', 'decode us', 'bytes'))
+    for payload_name, payload in PAYLOADS:
+        for codec in codecs:
+            encoded = codec.dumpb(payload)
+            encode = timeit.timeit(lambda: codec.dumpb(payload), number=args.number) / args.number
+            decode = timeit.timeit(lambda: codec.loads(encoded), number=args.number) / args.number
+            print('{:<24} {:<8} {:>12.1f} {:>12.1f} {:>10}'.format(
+                payload_name, codec.name, encode * 1e6, decode * 1e6, len(encoded)))
+
+
+if __name__ == '__main__':
+    main()
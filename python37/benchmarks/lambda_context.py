@@ -0,0 +1,120 @@
+"""
+Compares building the handler context eagerly, as the bootstrap used to,
+with the lazy LambdaContext for tiny events: the time to decode an
+invocation and the memory its context keeps alive, with the context
+headers untouched and with all of them read by the handler.
+
+    python3 benchmarks/lambda_context.py [--number N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bootstrap  # noqa: E402
+
+
+EVENT_BODY = b'{"ping": 1}'
+CLOUDEVENTS_CONTEXT = json.dumps({
+    'specversion': '1.0',
+    'id': 'a7c5b2d8-3e0f-4b1a-9c6d-2f8e7a1b0c3d',
+    'type': 'dev.knative.sources.ping',
+    'source': '/apis/v1/namespaces/default/pingsources/ping',
+    'datacontenttype': 'application/json',
+})
+CLIENT_CONTEXT = json.dumps({'custom': {'tenant': 'acme'}, 'env': {'locale': 'en'}, 'client': {'app_title': 'app'}})
+
+
+class EagerLambdaContext(object):
+    # the context as it was built before it was made lazy
+    def __init__(self, invoke_id, client_context, cloudevents_context, cognito_identity, epoch_deadline_time_in_ms, invoked_function_arn=None):
+        self.aws_request_id = invoke_id
+        self.log_group_name = os.environ.get('AWS_LAMBDA_LOG_GROUP_NAME')
+        self.log_stream_name = os.environ.get('AWS_LAMBDA_LOG_STREAM_NAME')
+        self.function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+        self.memory_limit_in_mb = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+        self.function_version = os.environ.get('AWS_LAMBDA_FUNCTION_VERSION')
+        self.invoked_function_arn = invoked_function_arn
+        self.ce = cloudevents_context
+        self.content_type = cloudevents_context.get('datacontenttype') if isinstance(cloudevents_context, dict) else None
+
+        self.client_context = None
+        if client_context is not None:
+            self.client_context = bootstrap.ClientContext()
+            for field in bootstrap.ClientContext.__slots__:
+                setattr(self.client_context, field, client_context.get(field))
+            client = self.client_context.client
+            if client is not None:
+                self.client_context.client = bootstrap.Client()
+                for field in bootstrap.Client.__slots__:
+                    setattr(self.client_context.client, field, client.get(field))
+
+        self.identity = bootstrap.CognitoIdentity()
+        self.identity.cognito_identity_id = None
+        self.identity.cognito_identity_pool_id = None
+        if cognito_identity is not None:
+            self.identity.cognito_identity_id = cognito_identity.get("cognitoIdentityId")
+            self.identity.cognito_identity_pool_id = cognito_identity.get("cognitoIdentityPoolId")
+
+        self._epoch_deadline_time_in_ms = epoch_deadline_time_in_ms
+
+
+def decode_eager(client_context_json, cloudevents_context_json, cognito_identity_json, deadline_time_in_ms):
+    client_context = json.loads(client_context_json) if client_context_json else None
+    cloudevents_context = json.loads(cloudevents_context_json) if cloudevents_context_json else None
+    cognito_identity = json.loads(cognito_identity_json) if cognito_identity_json else None
+    context = EagerLambdaContext('request-id', client_context, cloudevents_context, cognito_identity, deadline_time_in_ms, 'arn')
+    return json.loads(EVENT_BODY), context
+
+
+def decode_lazy(client_context_json, cloudevents_context_json, cognito_identity_json, deadline_time_in_ms):
+    return bootstrap.decode_event_request('request-id', EVENT_BODY, client_context_json, cloudevents_context_json,
+                                          cognito_identity_json, 'arn', deadline_time_in_ms)
+
+
+def read_all(decoded):
+    context = decoded[1]
+    context.function_name, context.ce, context.content_type, context.client_context, context.identity.cognito_identity_id
+    return decoded
+
+
+def retained_bytes(make, number):
+    contexts = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(number):
+            contexts.append(make())
+        return (tracemalloc.get_traced_memory()[0] - before) / number
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000, help='invocations per measurement')
+    args = parser.parse_args()
+
+    deadline_time_in_ms = int(time.time() * 1000) + 60000
+    headers = (CLIENT_CONTEXT, CLOUDEVENTS_CONTEXT, None, deadline_time_in_ms)
+    cases = [
+        ('eager', lambda: decode_eager(*headers)),
+        ('lazy', lambda: decode_lazy(*headers)),
+        ('eager, read all', lambda: read_all(decode_eager(*headers))),
+        ('lazy, read all', lambda: read_all(decode_lazy(*headers))),
+    ]
+    print('{:<18} {:>14} {:>18}'.format('context', 'decode us', 'retained bytes'))
+    for name, make in cases:
+        seconds = timeit.timeit(make, number=args.number) / args.number
+        retained = retained_bytes(make, args.number // 10)
+        print('{:<18} {:>14.2f} {:>18.0f}'.format(name, seconds * 1e6, retained))
+
+
+if __name__ == '__main__':
+    main()
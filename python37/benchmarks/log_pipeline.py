@@ -0,0 +1,77 @@
+"""
+Compares the unbuffered output of the bootstrap with the buffered log
+pipeline for handlers that log heavily. Every invocation writes lines
+with print() and the logging module and the output is flushed at the end,
+like before a result is posted.
+
+    python3 benchmarks/log_pipeline.py [--number N] [--lines N]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bootstrap  # noqa: E402
+from lambda_log_pipeline import LogPipeline  # noqa: E402
+
+
+def make_handler(lines):
+    logger = logging.getLogger('benchmark')
+
+    def handler(event, context):
+        for i in range(lines):
+            print('processing record', i, 'of', event['records'])
+            logger.info('record %s processed', i)
+        return event
+
+    return handler
+
+
+def configure_logging():
+    logger = logging.getLogger('benchmark')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger_handler = bootstrap.LambdaLoggerHandler()
+    logger_handler.setFormatter(logging.Formatter(
+        '[%(levelname)s]\t%(asctime)s.%(msecs)dZ\t%(aws_request_id)s\t%(message)s\n',
+        '%Y-%m-%dT%H:%M:%S'))
+    logger_handler.addFilter(bootstrap.LambdaLoggerFilter())
+    logger.addHandler(logger_handler)
+
+
+def measure(stream, handler, number):
+    stdout = sys.stdout
+    sys.stdout = stream
+    try:
+        def invoke():
+            handler({'records': 'all'}, None)
+            bootstrap.flush_log_output()
+        return timeit.timeit(invoke, number=number) / number
+    finally:
+        sys.stdout = stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=200, help='invocations per measurement')
+    parser.add_argument('--lines', type=int, default=100, help='print() and logging calls per invocation')
+    args = parser.parse_args()
+
+    configure_logging()
+    handler = make_handler(args.lines)
+    print('{:<12} {:>16} {:>16}'.format('output', 'invocation us', 'per line us'))
+    # a regular file, so that every flush costs a write system call
+    with tempfile.TemporaryFile('w') as output:
+        for name, stream in (('unbuffered', bootstrap.Unbuffered(output)),
+                             ('pipeline', LogPipeline().stream(output))):
+            seconds = measure(stream, handler, args.number)
+            print('{:<12} {:>16.1f} {:>16.2f}'.format(name, seconds * 1e6, seconds * 1e6 / (2 * args.lines)))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,20 +2,45 @@
 Copyright (c) 2018 Amazon. All rights reserved.
 """
 
+import argparse
+import asyncio
+import atexit
+import base64
+import collections.abc
+import compileall
+import contextlib
+import contextvars
+import cProfile
+import ctypes
+import datetime
 import decimal
+import gc
+import importlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import inspect
 import json
 import logging
+import math
 import os
+import py_compile
+import random
+import signal
 import site
 import sys
+import threading
 import time
 import traceback
-import warnings
-with warnings.catch_warnings():
-    warnings.filterwarnings("ignore", category=DeprecationWarning)
-    import imp
+import tracemalloc
+import uuid
 
-from lambda_runtime_client import LambdaRuntimeClient
+from lambda_lazy_json import loads_lazy
+from lambda_log_pipeline import LogPipeline
+from lambda_runtime_metrics import NULL_STAGE_TIMER, RuntimeMetrics, serve_metrics, write_metrics_periodically
+from lambda_runtime_client import LambdaRuntimeClient, AsyncLambdaRuntimeClient, InvocationPrefetcher, RequestInterrupted, ResultStreamError, is_result_stream
+
+_BOOTSTRAP_LOADED_AT = time.monotonic()
 
 
 class FaultData(object):
@@ -55,20 +80,16 @@ def _get_handler(handler):
         request_handler = make_fault_handler(fault)
         return request_handler
 
-    file_handle, pathname, desc = None, None, None
+    if modname in sys.builtin_module_names:
+        fault = FaultException("Cannot use built-in module {} as a handler module".format(modname), None, None)
+        request_handler = make_fault_handler(fault)
+        return request_handler
+
     try:
-        # Recursively loading handler in nested directories
-        for segment in modname.split('.'):
-            if pathname is not None:
-                pathname = [pathname]
-            file_handle, pathname, desc = imp.find_module(segment, pathname)
-        if file_handle is None:
-            module_type = desc[2]
-            if module_type == imp.C_BUILTIN:
-                fault = FaultException("Cannot use built-in module {} as a handler module".format(modname), None, None)
-                request_handler = make_fault_handler(fault)
-                return request_handler
-        m = imp.load_module(modname, file_handle, pathname, desc)
+        m = import_handler_module(modname)
+    except FaultException as fault:
+        request_handler = make_fault_handler(fault)
+        return request_handler
     except ImportError as e:
         fault = FaultException("Unable to import module '{}'".format(modname), str(e), None)
         request_handler = make_fault_handler(fault)
@@ -78,9 +99,6 @@ def _get_handler(handler):
         fault = FaultException("Syntax error in module '{}'".format(modname), str(e), trace)
         request_handler = make_fault_handler(fault)
         return request_handler
-    finally:
-        if file_handle is not None:
-            file_handle.close()
 
     try:
         request_handler = getattr(m, fname)
@@ -90,6 +108,121 @@ def _get_handler(handler):
     return request_handler
 
 
+def import_handler_module(modname):
+    """
+    Imports the handler module from sys.path. A module of the same name the
+    runtime imported already, e.g. queue or signal, is not taken for it: a
+    top-level handler module is loaded from its file anyway, without
+    replacing the module in sys.modules, and a handler in a package of such
+    a name is a fault.
+    """
+    top_name = modname.split('.', 1)[0]
+    loaded = sys.modules.get(top_name)
+    spec = find_module_spec(top_name)
+    if loaded is None or spec is None or getattr(getattr(loaded, '__spec__', None), 'origin', None) == spec.origin:
+        return importlib.import_module(modname)
+    if top_name != modname:
+        raise FaultException("Cannot use package {} for the handler module, the runtime imported a module of the same name".format(top_name))
+    m = importlib.util.module_from_spec(spec)
+    if spec.loader is not None:
+        spec.loader.exec_module(m)
+    return m
+
+
+def find_module_spec(modname):
+    """Locates a (possibly nested) module on sys.path without importing it or its packages."""
+    spec, path = None, None
+    segments = modname.split('.')
+    for i in range(len(segments)):
+        spec = importlib.machinery.PathFinder.find_spec('.'.join(segments[:i + 1]), path)
+        if spec is None:
+            return None
+        path = spec.submodule_search_locations
+    return spec
+
+
+def check_handler_bytecode(handler):
+    """Logs a warning when the handler module has not been precompiled at build time."""
+    modname = handler.rsplit('.', 1)[0]
+    spec = find_module_spec(modname)
+    if spec is None or not spec.has_location or not spec.origin.endswith('.py'):
+        return
+    if spec.cached is None or not os.path.exists(spec.cached):
+        log_runtime_event('init.bytecode_missing', level='WARNING', module=modname, source=spec.origin,
+                          hint='run "python3.7 /opt/bootstrap.py compile" in the image build')
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Measures how long every module imported while the timer is installed
+    takes to execute.
+
+    The timer sits in front of sys.meta_path, resolves specs through the
+    finders behind it and wraps the loader's exec_module for the duration of
+    that one import. Both the cumulative time (including nested imports) and
+    the self time of each module are recorded.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._nested_times = []
+
+    def __enter__(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self:
+                continue
+            find_spec = getattr(finder, 'find_spec', None)
+            if find_spec is None:
+                # let the regular import machinery deal with legacy finders
+                return None
+            spec = find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        loader = spec.loader
+        if loader is None or isinstance(loader, type) or not hasattr(loader, 'exec_module') \
+                or 'exec_module' in getattr(loader, '__dict__', {'exec_module': None}):
+            return spec
+
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module):
+            try:
+                self._timed_exec(module.__name__, exec_module, module)
+            finally:
+                del loader.exec_module
+
+        loader.exec_module = timed_exec_module
+        return spec
+
+    def _timed_exec(self, name, exec_module, module):
+        self._nested_times.append(0.0)
+        start = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested_times.pop()
+            if self._nested_times:
+                self._nested_times[-1] += elapsed
+            self.timings[name] = (elapsed, elapsed - nested)
+
+    def slowest(self, count):
+        """Returns the `count` modules with the highest self time."""
+        ranked = sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True)
+        return [{'module': name, 'self_ms': round(self_time * 1000, 3), 'cumulative_ms': round(cumulative * 1000, 3)}
+                for name, (cumulative, self_time) in ranked[:count]]
+
+
 class number_str(float):
     def __init__(self, o):
         self.o = o
@@ -98,12 +231,175 @@ class number_str(float):
         return str(self.o)
 
 
-def decimal_serializer(o):
+def json_default(o):
     if isinstance(o, decimal.Decimal):
         return number_str(o)
+    if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if isinstance(o, (bytes, bytearray, memoryview)):
+        return base64.b64encode(o).decode('ascii')
     raise TypeError(repr(o) + " is not JSON serializable")
 
 
+def float_text(value):
+    # the text json.dumps() writes for a float, including allow_nan constants
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == float('-inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+class StdlibJsonCodec(object):
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, default=json_default)
+
+    def dumpb(self, obj):
+        return self.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        if not isinstance(data, str):
+            # json.loads() would make the same decoded copy, but does not accept memoryview
+            data = str(data, 'utf-8')
+        return json.loads(data)
+
+
+class OrjsonJsonCodec(object):
+    """
+    orjson based codec. datetime, date, time and UUID values are serialized
+    natively, Decimal values are written as the same text the stdlib codec
+    produces through orjson.Fragment. The output is compact and not ASCII
+    escaped, but otherwise equivalent to the stdlib codec output; values
+    orjson rejects are serialized with the stdlib codec, and so are values
+    with NaN or infinite floats in their dicts, lists and tuples, which
+    orjson writes as null rather than NaN, Infinity and -Infinity.
+    """
+    name = 'orjson'
+
+    def __init__(self, orjson):
+        self.orjson = orjson
+        self.fragment = orjson.Fragment
+
+    def _default(self, o):
+        if isinstance(o, decimal.Decimal):
+            return self.fragment(float_text(float(o)))
+        if isinstance(o, (bytes, bytearray, memoryview)):
+            return base64.b64encode(o).decode('ascii')
+        raise TypeError(repr(o) + " is not JSON serializable")
+
+    def dumps(self, obj):
+        return self.dumpb(obj).decode('utf-8')
+
+    def dumpb(self, obj):
+        try:
+            data = self.orjson.dumps(obj, default=self._default, option=self.orjson.OPT_NON_STR_KEYS)
+        except self.orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which only the stdlib codec supports
+            return StdlibJsonCodec().dumpb(obj)
+        # only output with a null can have a non-finite float in it
+        if b'null' in data and has_non_finite_float(obj):
+            return StdlibJsonCodec().dumpb(obj)
+        return data
+
+    def loads(self, data):
+        return self.orjson.loads(data)
+
+
+def has_non_finite_float(obj):
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(has_non_finite_float(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(has_non_finite_float(item) for item in obj)
+    return False
+
+
+def make_json_codec(name):
+    """
+    Returns the JSON codec selected by KLR_JSON_CODEC: "json" for the
+    standard library, "orjson", or "auto" for orjson when it is installed.
+    """
+    if name not in ('auto', 'json', 'orjson'):
+        raise ValueError("Unknown JSON codec '{}', expected auto, json or orjson".format(name))
+    if name == 'json':
+        return StdlibJsonCodec()
+    try:
+        import orjson
+        return OrjsonJsonCodec(orjson)
+    except (ImportError, AttributeError):
+        # orjson is missing or older than 3.9, which added orjson.Fragment
+        if name == 'orjson':
+            raise
+        return StdlibJsonCodec()
+
+
+_JSON_CODEC = StdlibJsonCodec()
+
+
+def set_json_codec(codec):
+    global _JSON_CODEC
+    _JSON_CODEC = codec
+
+
+HANDLER_MODE_JSON = 'json'
+HANDLER_MODE_BINARY = 'binary'
+HANDLER_MODE_LAZY = 'lazy'
+HANDLER_MODES = (HANDLER_MODE_JSON, HANDLER_MODE_BINARY, HANDLER_MODE_LAZY)
+
+_HANDLER_MODE = HANDLER_MODE_JSON
+_LAZY_EVENT_KEY = 'Records'
+
+
+def set_handler_mode(mode):
+    global _HANDLER_MODE
+    if mode not in HANDLER_MODES:
+        raise ValueError("KLR_HANDLER_MODE must be one of {}, got {!r}".format(', '.join(HANDLER_MODES), mode))
+    _HANDLER_MODE = mode
+
+
+def set_lazy_event_key(key):
+    global _LAZY_EVENT_KEY
+    _LAZY_EVENT_KEY = key
+
+
+def get_handler_mode(request_handler):
+    return getattr(request_handler, 'klr_handler_mode', _HANDLER_MODE)
+
+
+def get_lazy_event_key(request_handler):
+    return getattr(request_handler, 'klr_lazy_event_key', _LAZY_EVENT_KEY)
+
+
+def binary_handler(handler):
+    """
+    Marks a handler as binary: it receives the raw event body (bytes or a
+    memoryview) instead of parsed JSON, and bytes-like results are posted
+    unchanged. Other results are still JSON encoded.
+    """
+    handler.klr_handler_mode = HANDLER_MODE_BINARY
+    return handler
+
+
+def lazy_event_handler(key='Records'):
+    """
+    Marks a handler as lazy: the array under `key` in the event is a
+    LazyJsonArray whose items are decoded one at a time while iterating.
+    """
+    def decorator(handler):
+        handler.klr_handler_mode = HANDLER_MODE_LAZY
+        handler.klr_lazy_event_key = key
+        return handler
+
+    return decorator
+
+
 def make_fault_handler(fault):
     def result(*args):
         raise fault
@@ -131,40 +427,242 @@ def make_error(errorMessage, errorType, stackTrace):  # stackTrace is an array
 
 
 def to_json(obj):
-    return json.dumps(obj, default=decimal_serializer)
+    return _JSON_CODEC.dumps(obj)
+
+
+def to_json_bytes(obj):
+    return _JSON_CODEC.dumpb(obj)
+
+
+def from_json(data):
+    return _JSON_CODEC.loads(data)
+
+
+def decode_event_request(invoke_id, event_body, client_context_json, cloudevents_context_json, cognito_identity_json, invoked_function_arn, epoch_deadline_time_in_ms, handler_mode=HANDLER_MODE_JSON, lazy_event_key=None, stage_timer=NULL_STAGE_TIMER):
+    if _METRICS is not None:
+        _METRICS.observe_payload('event', len(event_body))
+    stage_timer.lap('decode')
+    # the context headers are only decoded if the handler reads them
+    context = LambdaContext(invoke_id, client_context_json, cloudevents_context_json, cognito_identity_json, epoch_deadline_time_in_ms, invoked_function_arn)
+    request_context = _REQUEST_CONTEXT.get()
+    if request_context is not None and request_context.aws_request_id == invoke_id:
+        request_context.lambda_context = context
+    stage_timer.lap('context')
+    if handler_mode == HANDLER_MODE_BINARY:
+        return event_body, context
+    json_input = try_or_raise(lambda: decode_event_body(event_body, handler_mode, lazy_event_key), "Unable to parse input as json")
+    stage_timer.lap('decode')
+    return json_input, context
+
+
+def decode_event_body(event_body, handler_mode=HANDLER_MODE_JSON, lazy_event_key=None):
+    if handler_mode == HANDLER_MODE_BINARY:
+        return event_body
+    if handler_mode == HANDLER_MODE_LAZY:
+        return loads_lazy(str(event_body, 'utf-8'), lazy_event_key)
+    return from_json(event_body)
+
+
+def encode_result(result, handler_mode=HANDLER_MODE_JSON):
+    if is_result_stream(result):
+        # iterators of bytes/str chunks are streamed to the response as they are produced
+        return result
+    if handler_mode == HANDLER_MODE_BINARY and isinstance(result, (bytes, bytearray, memoryview)):
+        return result
+    if result is not None:
+        result = try_or_raise(lambda: to_json_bytes(result), "An error occurred during JSON serialization of response")
+    return result
 
 
-def handle_event_request(lambda_runtime_client, request_handler, invoke_id, event_body, client_context_json, cloudevents_context_json, cognito_identity_json, invoked_function_arn, epoch_deadline_time_in_ms):
-    error_result = None
-    try:
-        client_context = None
-        if client_context_json:
-            client_context = try_or_raise(lambda: json.loads(client_context_json), "Unable to parse client context json")
-        cloudevents_context = None
-        if cloudevents_context_json:
-            cloudevents_context = try_or_raise(lambda: json.loads(cloudevents_context_json), "Unable to parse cloudevents context json")
-        cognito_identity = None
-        if cognito_identity_json:
-            cognito_identity = try_or_raise(lambda: json.loads(cognito_identity_json), "Unable to parse cognito identity json")
-        context = LambdaContext(invoke_id, client_context, cloudevents_context, cognito_identity, epoch_deadline_time_in_ms, invoked_function_arn)
-        json_input = try_or_raise(lambda: json.loads(event_body.decode()), "Unable to parse input as json")
-        result = request_handler(json_input, context)
-        if result is not None:
-            result = try_or_raise(lambda: to_json(result), "An error occurred during JSON serialization of response")
-    except FaultException as e:
+def build_error_result(invoke_id, e):
+    if isinstance(e, FaultException):
         error_result = make_error(e.msg, None, None)
-        error_result = to_json(error_result)
-    except JsonError as e:
+    elif isinstance(e, JsonError):
         error_result = build_fault_result(invoke_id, e.exc_info, e.msg)
-        error_result = to_json(error_result)
-    except Exception as e:
-        error_result = build_fault_result(invoke_id, sys.exc_info(), None)
-        error_result = to_json(error_result)
+    elif isinstance(e, InvocationTimeout):
+        # only the handler frames that were interrupted are of interest, if any
+        tb_tuples = [tb_tuple for tb_tuple in extract_traceback(e.__traceback__)
+                     if "/bootstrap.py" not in tb_tuple[0] and "/lambda_runtime_client.py" not in tb_tuple[0]]
+        error_result = make_error(str(e), type(e).__name__, traceback.format_list(tb_tuples))
+    else:
+        error_result = build_fault_result(invoke_id, (type(e), e, e.__traceback__), None)
+    if _METRICS is not None:
+        _METRICS.count_error(error_result.get('errorType', 'Unknown'))
+    return to_json(error_result)
+
+
+def handle_event_request(lambda_runtime_client, request_handler, invoke_id, event_body, client_context_json, cloudevents_context_json, cognito_identity_json, invoked_function_arn, epoch_deadline_time_in_ms, release_event_body=None, stage_timer=NULL_STAGE_TIMER):
+    handler_mode = get_handler_mode(request_handler)
+    result = None
+    error_result = None
+    try:
+        try:
+            json_input, context = decode_event_request(invoke_id, event_body, client_context_json, cloudevents_context_json, cognito_identity_json, invoked_function_arn, epoch_deadline_time_in_ms, handler_mode, get_lazy_event_key(request_handler), stage_timer)
+        finally:
+            # the body buffer can be reused (e.g. by a prefetch) as soon as the event is parsed,
+            # unless the handler was given the buffer itself
+            if release_event_body is not None and handler_mode != HANDLER_MODE_BINARY:
+                release_event_body()
+                release_event_body = None
+        if _DEADLINE_ENFORCER is not None:
+            result = _DEADLINE_ENFORCER.call(epoch_deadline_time_in_ms, request_handler, json_input, context)
+        else:
+            result = request_handler(json_input, context)
+        stage_timer.lap('handler')
+        result = encode_result(result, handler_mode)
+    except (Exception, InvocationTimeout) as e:
+        stage_timer.lap('handler')
+        error_result = build_error_result(invoke_id, e)
+    stage_timer.lap('encode')
 
+    try:
+        post_event_response(lambda_runtime_client, invoke_id, result, error_result)
+    finally:
+        if release_event_body is not None:
+            release_event_body()
+    stage_timer.lap('post')
+    stage_timer.finish()
+
+
+def post_event_response(lambda_runtime_client, invoke_id, result, error_result):
+    flush_log_output()
+    if _METRICS is not None and error_result is None and isinstance(result, (bytes, bytearray)):
+        _METRICS.observe_payload('result', len(result))
+    if error_result is None:
+        try:
+            lambda_runtime_client.post_invocation_result(invoke_id, result)
+        except ResultStreamError as e:
+            error_result = build_error_result(invoke_id, e.__cause__)
     if error_result is not None:
         lambda_runtime_client.post_invocation_error(invoke_id, error_result)
-    else:
-        lambda_runtime_client.post_invocation_result(invoke_id, result)
+
+
+def handle_event_batch(lambda_runtime_client, request_handler, event_requests, stage_timer=NULL_STAGE_TIMER):
+    """
+    Calls a batch handler once with a list of (event, context) pairs and
+    posts each returned result to its own invocation. Exception instances
+    in the returned list are posted as errors of their invocation, and an
+    exception raised by the handler is posted to every invocation.
+
+    The handler is interrupted at the earliest deadline of the batch. The
+    timeout is posted to the invocations whose deadline has passed, and the
+    handler is called again with the rest of the batch.
+    """
+    handler_mode = get_handler_mode(request_handler)
+    lazy_event_key = get_lazy_event_key(request_handler)
+    batch = []
+    batch_requests = []
+    try:
+        for event_request in event_requests:
+            try:
+                if _DEADLINE_ENFORCER is not None:
+                    _DEADLINE_ENFORCER.check_deadline(event_request.deadline_time_in_ms)
+                try:
+                    batch.append(decode_event_request(event_request.invoke_id,
+                                                      event_request.event_body,
+                                                      event_request.client_context,
+                                                      event_request.cloudevents_context,
+                                                      event_request.cognito_identity,
+                                                      event_request.invoked_function_arn,
+                                                      event_request.deadline_time_in_ms,
+                                                      handler_mode,
+                                                      lazy_event_key,
+                                                      stage_timer))
+                finally:
+                    if handler_mode != HANDLER_MODE_BINARY:
+                        event_request.release_event_body()
+            except (Exception, InvocationTimeout) as e:
+                post_event_response(lambda_runtime_client, event_request.invoke_id, None, build_error_result(event_request.invoke_id, e))
+                continue
+            batch_requests.append(event_request)
+
+        if not batch:
+            return
+        while True:
+            batch_error = None
+            # the batch is interrupted at the earliest deadline of its invocations
+            epoch_deadline_time_in_ms = min(event_request.deadline_time_in_ms for event_request in batch_requests)
+            try:
+                if _DEADLINE_ENFORCER is not None:
+                    results = _DEADLINE_ENFORCER.call(epoch_deadline_time_in_ms, lambda: list(request_handler(batch)))
+                else:
+                    results = list(request_handler(batch))
+                if len(results) != len(batch):
+                    raise ValueError("Batch handler returned {} results for {} events".format(len(results), len(batch)))
+            except InvocationTimeout as e:
+                stage_timer.lap('handler')
+                # the earliest deadline counts as passed whatever the clock says
+                expired_at = max(time.time() * 1000, epoch_deadline_time_in_ms)
+                unexpired = []
+                for event_request, event in zip(batch_requests, batch):
+                    if event_request.deadline_time_in_ms <= expired_at:
+                        post_event_response(lambda_runtime_client, event_request.invoke_id, None, build_error_result(event_request.invoke_id, e))
+                    else:
+                        unexpired.append((event_request, event))
+                batch_requests = [event_request for event_request, _ in unexpired]
+                batch = [event for _, event in unexpired]
+                if batch:
+                    continue
+                results = []
+            except Exception as e:
+                batch_error = e
+                results = [None] * len(batch)
+            stage_timer.lap('handler')
+            break
+
+        for event_request, result in zip(batch_requests, results):
+            invoke_id = event_request.invoke_id
+            error_result = None
+            if batch_error is not None:
+                error_result = build_error_result(invoke_id, batch_error)
+            elif isinstance(result, Exception):
+                error_result = build_error_result(invoke_id, result)
+            else:
+                try:
+                    result = encode_result(result, handler_mode)
+                except Exception as e:
+                    error_result = build_error_result(invoke_id, e)
+            stage_timer.lap('encode')
+            post_event_response(lambda_runtime_client, invoke_id, result, error_result)
+            stage_timer.lap('post')
+    finally:
+        for event_request in event_requests:
+            event_request.release_event_body()
+    stage_timer.finish()
+
+
+async def handle_event_request_async(lambda_runtime_client, request_handler, invoke_id, event_body, client_context_json, cloudevents_context_json, cognito_identity_json, invoked_function_arn, epoch_deadline_time_in_ms, stage_timer=NULL_STAGE_TIMER):
+    result = None
+    error_result = None
+    try:
+        handler_mode = get_handler_mode(request_handler)
+        json_input, context = decode_event_request(invoke_id, event_body, client_context_json, cloudevents_context_json, cognito_identity_json, invoked_function_arn, epoch_deadline_time_in_ms, handler_mode, get_lazy_event_key(request_handler), stage_timer)
+        if _DEADLINE_ENFORCER is not None:
+            result = await _DEADLINE_ENFORCER.call_async(epoch_deadline_time_in_ms, request_handler, json_input, context)
+        else:
+            result = request_handler(json_input, context)
+            if inspect.isawaitable(result):
+                # async generator handlers return their (async iterator) result directly
+                result = await result
+        stage_timer.lap('handler')
+        result = encode_result(result, handler_mode)
+    except (Exception, InvocationTimeout) as e:
+        stage_timer.lap('handler')
+        error_result = build_error_result(invoke_id, e)
+    stage_timer.lap('encode')
+
+    flush_log_output()
+    if error_result is None:
+        if _METRICS is not None and isinstance(result, (bytes, bytearray)):
+            _METRICS.observe_payload('result', len(result))
+        try:
+            await lambda_runtime_client.post_invocation_result(invoke_id, result)
+        except ResultStreamError as e:
+            error_result = build_error_result(invoke_id, e.__cause__)
+    if error_result is not None:
+        await lambda_runtime_client.post_invocation_error(invoke_id, error_result)
+    stage_timer.lap('post')
+    stage_timer.finish()
 
 
 def build_fault_result(invoke_id, exc_info, msg):
@@ -177,7 +675,8 @@ def build_fault_result(invoke_id, exc_info, msg):
     tb_tuples = extract_traceback(tb)
 
     for i in range(len(tb_tuples)):
-        if "/bootstrap.py" not in tb_tuples[i][0]:  # filename of the tb tuple
+        filename = tb_tuples[i][0]
+        if "/bootstrap.py" not in filename and "/lambda_runtime_client.py" not in filename:
             tb_tuples = tb_tuples[i:]
             break
 
@@ -199,51 +698,187 @@ def extract_traceback(tb):
 class CognitoIdentity(object):
     __slots__ = ["cognito_identity_id", "cognito_identity_pool_id"]
 
+    def __init__(self, cognito_identity_id=None, cognito_identity_pool_id=None):
+        self.cognito_identity_id = cognito_identity_id
+        self.cognito_identity_pool_id = cognito_identity_pool_id
+
 
 class Client(object):
     __slots__ = ["installation_id", "app_title", "app_version_name", "app_version_code", "app_package_name"]
 
+    def __init__(self, installation_id=None, app_title=None, app_version_name=None, app_version_code=None, app_package_name=None):
+        self.installation_id = installation_id
+        self.app_title = app_title
+        self.app_version_name = app_version_name
+        self.app_version_code = app_version_code
+        self.app_package_name = app_package_name
+
+    @classmethod
+    def from_dict(cls, client):
+        return cls(client.get('installation_id'),
+                   client.get('app_title'),
+                   client.get('app_version_name'),
+                   client.get('app_version_code'),
+                   client.get('app_package_name'))
+
 
 class ClientContext(object):
     __slots__ = ['custom', 'env', 'client']
 
+    def __init__(self, custom=None, env=None, client=None):
+        self.custom = custom
+        self.env = env
+        self.client = client
 
-def make_obj_from_dict(_class, _dict, fields=None):
-    if _dict is None:
-        return None
-    obj = _class()
-    set_obj_from_dict(obj, _dict)
-    return obj
+    @classmethod
+    def from_dict(cls, client_context):
+        client = client_context.get('client')
+        return cls(client_context.get('custom'),
+                   client_context.get('env'),
+                   Client.from_dict(client) if client is not None else None)
 
 
-def set_obj_from_dict(obj, _dict, fields=None):
-    if fields is None:
-        fields = obj.__class__.__slots__
-    for field in fields:
-        setattr(obj, field, _dict.get(field, None))
+class RequestContext(object):
+    """
+    State of the invocation being handled. It is kept in a context variable,
+    so every thread and asyncio task sees the invocation it is handling.
+    """
+    __slots__ = ('aws_request_id', 'xray_trace_id', 'deadline_time_in_ms', 'lambda_context')
 
+    def __init__(self, aws_request_id, xray_trace_id, deadline_time_in_ms):
+        self.aws_request_id = aws_request_id
+        self.xray_trace_id = xray_trace_id
+        self.deadline_time_in_ms = deadline_time_in_ms
+        # set once the event is decoded
+        self.lambda_context = None
+
+    @property
+    def cloudevents_context(self):
+        if self.lambda_context is None:
+            return None
+        return self.lambda_context.ce
+
+
+_REQUEST_CONTEXT = contextvars.ContextVar('klr_request_context', default=None)
+
+# the context of the latest invocation, for threads started by the handler,
+# which begin with an empty context; only kept while invocations are serial
+_PROCESS_REQUEST_CONTEXT = None
+_SERIAL_INVOCATIONS = True
 
-class LambdaContext(object):
-    def __init__(self, invoke_id, client_context, cloudevents_context, cognito_identity, epoch_deadline_time_in_ms, invoked_function_arn=None):
-        self.aws_request_id = invoke_id
-        self.log_group_name = os.environ.get('AWS_LAMBDA_LOG_GROUP_NAME')
-        self.log_stream_name = os.environ.get('AWS_LAMBDA_LOG_STREAM_NAME')
-        self.function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
-        self.memory_limit_in_mb = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
-        self.function_version = os.environ.get('AWS_LAMBDA_FUNCTION_VERSION')
-        self.invoked_function_arn = invoked_function_arn
-        self.ce = cloudevents_context
 
-        self.client_context = make_obj_from_dict(ClientContext, client_context)
-        if self.client_context is not None:
-            self.client_context.client = make_obj_from_dict(Client, self.client_context.client)
+def set_serial_invocations(serial):
+    global _SERIAL_INVOCATIONS, _PROCESS_REQUEST_CONTEXT
+    _SERIAL_INVOCATIONS = serial
+    _PROCESS_REQUEST_CONTEXT = None
 
-        self.identity = make_obj_from_dict(CognitoIdentity, {})
-        if cognito_identity is not None:
-            self.identity.cognito_identity_id = cognito_identity.get("cognitoIdentityId")
-            self.identity.cognito_identity_pool_id = cognito_identity.get("cognitoIdentityPoolId")
+# mirror the trace id of the invocation to os.environ['_X_AMZN_TRACE_ID']
+_TRACE_ENV_COMPAT = True
 
+
+def set_trace_env_compat(enabled):
+    global _TRACE_ENV_COMPAT
+    _TRACE_ENV_COMPAT = enabled
+
+
+def get_request_context():
+    """
+    Returns the RequestContext of the invocation handled by the calling
+    thread or asyncio task, or None before the first invocation. Threads
+    started by the handler get the invocation being handled as long as
+    only one invocation is in flight at a time.
+    """
+    request_context = _REQUEST_CONTEXT.get()
+    if request_context is None:
+        return _PROCESS_REQUEST_CONTEXT
+    return request_context
+
+
+def start_request_context(event_request):
+    global _PROCESS_REQUEST_CONTEXT
+    request_context = RequestContext(event_request.invoke_id, event_request.x_amzn_trace_id, event_request.deadline_time_in_ms)
+    _REQUEST_CONTEXT.set(request_context)
+    if _SERIAL_INVOCATIONS:
+        _PROCESS_REQUEST_CONTEXT = request_context
+    if _TRACE_ENV_COMPAT:
+        update_xray_env_variable(event_request.x_amzn_trace_id)
+    return request_context
+
+
+_UNDECODED = object()
+
+
+def decode_context_header(header_json, error_message):
+    if not header_json:
+        return None
+    return try_or_raise(lambda: from_json(header_json), error_message)
+
+
+class LambdaContext(object):
+    """
+    The context argument of handlers.
+
+    The values that are the same for every invocation of the process are
+    class attributes read from the environment once, and the client
+    context, CloudEvents context and Cognito identity headers are decoded
+    the first time they are accessed.
+    """
+    __slots__ = ('aws_request_id', 'invoked_function_arn', '_epoch_deadline_time_in_ms',
+                 '_client_context_json', '_cloudevents_context_json', '_cognito_identity_json',
+                 '_client_context', '_ce', '_identity')
+
+    log_group_name = None
+    log_stream_name = None
+    function_name = None
+    memory_limit_in_mb = None
+    function_version = None
+
+    @classmethod
+    def load_environment(cls):
+        cls.log_group_name = os.environ.get('AWS_LAMBDA_LOG_GROUP_NAME')
+        cls.log_stream_name = os.environ.get('AWS_LAMBDA_LOG_STREAM_NAME')
+        cls.function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+        cls.memory_limit_in_mb = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+        cls.function_version = os.environ.get('AWS_LAMBDA_FUNCTION_VERSION')
+
+    def __init__(self, invoke_id, client_context_json, cloudevents_context_json, cognito_identity_json, epoch_deadline_time_in_ms, invoked_function_arn=None):
+        self.aws_request_id = invoke_id
+        self.invoked_function_arn = invoked_function_arn
         self._epoch_deadline_time_in_ms = epoch_deadline_time_in_ms
+        self._client_context_json = client_context_json
+        self._cloudevents_context_json = cloudevents_context_json
+        self._cognito_identity_json = cognito_identity_json
+        self._client_context = _UNDECODED
+        self._ce = _UNDECODED
+        self._identity = _UNDECODED
+
+    @property
+    def client_context(self):
+        if self._client_context is _UNDECODED:
+            client_context = decode_context_header(self._client_context_json, "Unable to parse client context json")
+            self._client_context = ClientContext.from_dict(client_context) if client_context is not None else None
+        return self._client_context
+
+    @property
+    def ce(self):
+        if self._ce is _UNDECODED:
+            self._ce = decode_context_header(self._cloudevents_context_json, "Unable to parse cloudevents context json")
+        return self._ce
+
+    @property
+    def content_type(self):
+        ce = self.ce
+        return ce.get('datacontenttype') if isinstance(ce, dict) else None
+
+    @property
+    def identity(self):
+        if self._identity is _UNDECODED:
+            cognito_identity = decode_context_header(self._cognito_identity_json, "Unable to parse cognito identity json")
+            if cognito_identity is not None:
+                self._identity = CognitoIdentity(cognito_identity.get("cognitoIdentityId"), cognito_identity.get("cognitoIdentityPoolId"))
+            else:
+                self._identity = CognitoIdentity()
+        return self._identity
 
     def get_remaining_time_in_millis(self):
         epoch_now_in_ms = int(time.time() * 1000)
@@ -254,6 +889,9 @@ class LambdaContext(object):
         sys.stdout.write(str(msg))
 
 
+LambdaContext.load_environment()
+
+
 class LambdaLoggerHandler(logging.Handler):
     def __init__(self):
         logging.Handler.__init__(self)
@@ -265,10 +903,90 @@ class LambdaLoggerHandler(logging.Handler):
 
 class LambdaLoggerFilter(logging.Filter):
     def filter(self, record):
-        record.aws_request_id = _GLOBAL_AWS_REQUEST_ID or ""
+        request_context = get_request_context()
+        record.aws_request_id = request_context.aws_request_id if request_context is not None else ""
         return True
 
 
+LOG_FORMAT_TEXT = 'text'
+LOG_FORMAT_JSON = 'json'
+LOG_FORMATS = (LOG_FORMAT_TEXT, LOG_FORMAT_JSON)
+
+
+class JsonLogFormatter(logging.Formatter):
+    """
+    Formats log records as one JSON object per line, encoded with the
+    runtime's JSON codec, with the request id, trace id, function name and
+    CloudEvent id and type of the invocation as fields.
+    """
+
+    def __init__(self):
+        logging.Formatter.__init__(self)
+        self.function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+
+    def format(self, record):
+        log_record = {
+            'timestamp': '{}.{:03d}Z'.format(time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)), int(record.msecs)),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'aws_request_id': None,
+            'xray_trace_id': None,
+            'function_name': self.function_name,
+        }
+        request_context = get_request_context()
+        if request_context is not None:
+            log_record['aws_request_id'] = request_context.aws_request_id
+            log_record['xray_trace_id'] = request_context.xray_trace_id
+            cloudevent = request_context.cloudevents_context
+        else:
+            cloudevent = None
+        if isinstance(cloudevent, dict):
+            log_record['cloudevent_id'] = cloudevent.get('id')
+            log_record['cloudevent_type'] = cloudevent.get('type')
+        if record.exc_info:
+            log_record['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            log_record['stack_info'] = self.formatStack(record.stack_info)
+        return to_json(log_record)
+
+
+class LogSamplingFilter(logging.Filter):
+    """Keeps the given fraction of the records of each level, records of other levels are all kept."""
+
+    def __init__(self, rates):
+        logging.Filter.__init__(self)
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+def get_log_format():
+    log_format = os.environ.get('KLR_LOG_FORMAT', LOG_FORMAT_TEXT)
+    if log_format not in LOG_FORMATS:
+        raise ValueError("KLR_LOG_FORMAT must be one of {}, got {!r}".format(', '.join(LOG_FORMATS), log_format))
+    return log_format
+
+
+def get_log_sample_rates():
+    # e.g. "DEBUG=0.01,INFO=0.1" keeps 1% of the debug and 10% of the info records
+    rates = {}
+    for item in os.environ.get('KLR_LOG_SAMPLE_RATES', '').split(','):
+        if not item.strip():
+            continue
+        level_name, _, rate = item.partition('=')
+        level = logging.getLevelName(level_name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError("KLR_LOG_SAMPLE_RATES has an unknown log level {!r}".format(level_name))
+        rate = float(rate)
+        if not 0 <= rate <= 1:
+            raise ValueError("KLR_LOG_SAMPLE_RATES rates must be between 0 and 1, got {} for {}".format(rate, level_name))
+        rates[level] = rate
+    return rates
+
+
 class JsonError(Exception):
     def __init__(self, exc_info, msg):
         self.exc_info = exc_info
@@ -290,6 +1008,13 @@ class Unbuffered(object):
         self.stream.writelines(msgs)
         self.stream.flush()
 
+def is_env_flag_set(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
 def is_pythonpath_set():
     return "PYTHONPATH" in os.environ
 
@@ -320,12 +1045,177 @@ def set_default_sys_path():
     sys.path.insert(0, os.environ['LAMBDA_TASK_ROOT'])
 
 
-def add_default_site_directories():
+def get_default_site_directories():
     # Set '/var/task as site directory so that we are able to load all customer .pth files
-    site.addsitedir(os.environ["LAMBDA_TASK_ROOT"])
+    site_directories = [os.environ["LAMBDA_TASK_ROOT"]]
     if not is_pythonpath_set():
-        site.addsitedir(get_opt_site_packages_directory())
-        site.addsitedir(get_opt_python_directory())
+        site_directories.append(get_opt_site_packages_directory())
+        site_directories.append(get_opt_python_directory())
+    return site_directories
+
+
+def add_default_site_directories():
+    for site_directory in get_default_site_directories():
+        site.addsitedir(site_directory)
+
+
+PATH_MANIFEST_VERSION = 2
+
+
+def get_path_manifest_path():
+    return os.environ.get('KLR_PATH_MANIFEST') or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '.klr_path_manifest.json')
+
+
+def get_mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def list_pth_files(site_directory):
+    # same selection and order as site.addsitedir()
+    try:
+        names = os.listdir(site_directory)
+    except OSError:
+        return []
+    return [os.path.join(site_directory, name) for name in sorted(names) if name.endswith('.pth')]
+
+
+def read_pth_imports(pth_file):
+    # site.addpackage() executes the lines of a .pth file that start with an import statement
+    with open(pth_file) as pth:
+        return [[number, line.rstrip()] for number, line in enumerate(pth, 1) if line.startswith(("import ", "import\t"))]
+
+
+def exec_pth_import(sitedir, pth_import):
+    # run in a frame with the locals of site.addpackage() that .pth lines
+    # use, e.g. setuptools' *-nspkg.pth reads sys._getframe(1).f_locals['sitedir']
+    exec(pth_import)
+
+
+def run_pth_imports(sitedir, pth_file, pth_imports):
+    for number, pth_import in pth_imports:
+        try:
+            exec_pth_import(sitedir, pth_import)
+        except Exception:
+            # reported and handled like site.addpackage() does
+            sys.stderr.write("Error processing line {:d} of {}:\n\n".format(number, pth_file))
+            for record in traceback.format_exception(*sys.exc_info()):
+                for line in record.splitlines():
+                    sys.stderr.write('  ' + line + '\n')
+            sys.stderr.write("\nRemainder of file ignored\n")
+            break
+
+
+def write_path_manifest(manifest_path):
+    """
+    Resolves sys.path the way set_default_sys_path() and
+    add_default_site_directories() do at startup and stores the result,
+    along with the modification times it depends on, in `manifest_path`.
+    """
+    # the manifest may live in a scanned directory, create it before taking
+    # the directory mtimes so that writing its content does not change them
+    open(manifest_path, 'a').close()
+
+    sys_path_before = list(sys.path)
+    site_directories = get_default_site_directories()
+    mtimes = {}
+    pth_imports = []
+    for site_directory in site_directories:
+        mtimes[site_directory] = get_mtime_ns(site_directory)
+        for pth_file in list_pth_files(site_directory):
+            mtimes[pth_file] = get_mtime_ns(pth_file)
+            imports = read_pth_imports(pth_file)
+            if imports:
+                pth_imports.append({'sitedir': site_directory, 'pth_file': pth_file, 'imports': imports})
+
+    set_default_sys_path()
+    add_default_site_directories()
+
+    manifest = {
+        'version': PATH_MANIFEST_VERSION,
+        'python': list(sys.version_info[:2]),
+        'task_root': os.environ['LAMBDA_TASK_ROOT'],
+        'pythonpath_set': is_pythonpath_set(),
+        'sys_path_before': sys_path_before,
+        'sys_path': list(sys.path),
+        'pth_imports': pth_imports,
+        'mtimes': mtimes,
+    }
+    with open(manifest_path, 'w') as manifest_file:
+        manifest_file.write(to_json(manifest))
+
+
+def compile_function_bundle(handler=None):
+    """
+    Precompiles the function code and the /opt/python layers to unchecked
+    hash-based pycs, which are loaded without checking the source files.
+    Returns False when the handler module is missing or does not compile.
+    """
+    compiled_directories = []
+    for directory in [os.environ['LAMBDA_TASK_ROOT'], get_opt_python_directory()]:
+        directory = os.path.realpath(directory)
+        if not os.path.isdir(directory) or \
+                any(directory == parent or directory.startswith(parent + os.sep) for parent in compiled_directories):
+            continue
+        compileall.compile_dir(directory, maxlevels=100, quiet=1,
+                               invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+        compiled_directories.append(directory)
+
+    if not handler:
+        return True
+
+    set_default_sys_path()
+    add_default_site_directories()
+    modname = handler.rsplit('.', 1)[0]
+    spec = find_module_spec(modname)
+    if spec is None:
+        sys.stderr.write("Handler module '{}' not found\n".format(modname))
+        return False
+    if spec.has_location and spec.origin.endswith('.py'):
+        return compileall.compile_file(spec.origin, quiet=1,
+                                       invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+    return True
+
+
+def load_path_manifest(manifest_path):
+    """
+    Applies a manifest written by write_path_manifest() instead of scanning
+    the site directories. Returns False, leaving sys.path untouched, when
+    there is no manifest or it no longer matches the environment.
+    """
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        log_runtime_event('init.path_manifest_stale', manifest=manifest_path, reason=str(e))
+        return False
+
+    stale_reason = None
+    if manifest.get('version') != PATH_MANIFEST_VERSION or manifest.get('python') != list(sys.version_info[:2]):
+        stale_reason = 'version'
+    elif manifest.get('task_root') != os.environ['LAMBDA_TASK_ROOT'] or manifest.get('pythonpath_set') != is_pythonpath_set():
+        stale_reason = 'environment'
+    elif manifest.get('sys_path_before') != sys.path:
+        stale_reason = 'sys.path'
+    else:
+        for path, mtime in manifest['mtimes'].items():
+            if get_mtime_ns(path) != mtime:
+                stale_reason = 'modified: {}'.format(path)
+                break
+
+    if stale_reason is not None:
+        log_runtime_event('init.path_manifest_stale', manifest=manifest_path, reason=stale_reason)
+        return False
+
+    sys.path[:] = manifest['sys_path']
+    for pth_imports in manifest['pth_imports']:
+        run_pth_imports(pth_imports['sitedir'], pth_imports['pth_file'], pth_imports['imports'])
+    return True
 
 
 def set_ld_library_path_variable():
@@ -351,59 +1241,1286 @@ def update_xray_env_variable(xray_trace_id):
         if '_X_AMZN_TRACE_ID' in os.environ:
             del os.environ['_X_AMZN_TRACE_ID']
 
-_GLOBAL_AWS_REQUEST_ID = None
+def is_async_handler(request_handler):
+    return inspect.iscoroutinefunction(request_handler) or \
+        inspect.isasyncgenfunction(request_handler) or \
+        inspect.iscoroutinefunction(getattr(request_handler, '__call__', None))
+
+
+def is_prefetch_enabled():
+    return is_env_flag_set('KLR_PREFETCH')
+
+
+def get_async_concurrency():
+    # number of invocations an async handler keeps in flight on the event loop
+    return int(os.environ.get('KLR_ASYNC_CONCURRENCY', '1'))
+
+
+def get_import_timings_top():
+    # number of slowest handler dependencies reported at init, 0 disables import timing
+    return int(os.environ.get('KLR_IMPORT_TIMINGS_TOP', '10'))
+
+
+def get_thread_count():
+    # number of threads that handle invocations of a sync handler concurrently
+    return int(os.environ.get('KLR_THREADS', '1'))
+
+
+def get_batch_size():
+    # maximum number of queued invocations passed to one call of a batch handler, 1 disables batching
+    return int(os.environ.get('KLR_BATCH_SIZE', '1'))
+
+
+def get_batch_linger_ms():
+    # how long a batch waits for more invocations after its first one
+    return float(os.environ.get('KLR_BATCH_LINGER_MS', '5'))
+
+
+def get_batch_max_bytes():
+    # no more invocations are added to a batch once its event bodies reach this size
+    return int(os.environ.get('KLR_BATCH_MAX_BYTES', str(6 * 1024 * 1024)))
+
+
+def is_trace_env_compat_enabled(concurrent):
+    value = os.environ.get('KLR_TRACE_ENV_COMPAT', 'auto')
+    if value.lower() == 'auto':
+        # with more than one invocation in flight the process environment
+        # cannot hold the trace id of each of them
+        return not concurrent
+    return is_env_flag_set('KLR_TRACE_ENV_COMPAT')
+
+
+def is_log_buffering_enabled():
+    return is_env_flag_set('KLR_LOG_BUFFERING', default=True)
+
+
+def get_log_flush_interval_ms():
+    # buffered output is written at the latest this long after it was logged
+    return float(os.environ.get('KLR_LOG_FLUSH_INTERVAL_MS', '50'))
+
+
+def get_log_buffer_bytes():
+    # logging blocks on writing the output once this much is buffered
+    return int(os.environ.get('KLR_LOG_BUFFER_BYTES', str(1024 * 1024)))
+
+
+def flush_log_output():
+    # the output of an invocation is written before its result is posted
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+
+def exit_on_signal(signum, frame):
+    # atexit handlers do not run when a signal terminates the process, so
+    # buffered output is written here and the conventional 128+N is returned
+    flush_log_output()
+    os._exit(128 + signum)
+
+
+def is_deadline_enforced():
+    return is_env_flag_set('KLR_DEADLINE_ENFORCEMENT', default=True)
+
+
+def get_deadline_grace_ms():
+    # how long an invocation may overrun its deadline before the process is recycled
+    return int(os.environ.get('KLR_DEADLINE_GRACE_MS', '2000'))
+
+
+def get_tracemalloc_top():
+    # number of fastest growing allocation sites logged by the memory watchdog, 0 disables tracemalloc
+    return int(os.environ.get('KLR_TRACEMALLOC_TOP', '0'))
+
+
+def get_prefork_workers():
+    # number of worker processes forked from a parent that imported the handler once
+    return int(os.environ.get('KLR_PREFORK_WORKERS', '0'))
+
+
+def get_invoker_count():
+    # number of bootstrap processes the sidecar runs side by side
+    return int(os.environ.get('INVOKER_COUNT') or '1')
+
+
+def get_metrics_file_interval():
+    # seconds between two rewrites of KLR_METRICS_FILE
+    return float(os.environ.get('KLR_METRICS_FILE_INTERVAL', '10'))
+
+
+def log_runtime_event(event_type, **fields):
+    # runtime diagnostics are written to stderr as one JSON object per line
+    record = {'type': event_type}
+    record.update(fields)
+    sys.stderr.write(to_json(record) + '\n')
+
+
+def get_process_start_time():
+    """
+    Returns the process start time on the time.monotonic() clock, or None
+    when it cannot be determined. The resolution is one clock tick (usually 10ms).
+    """
+    try:
+        with open('/proc/self/stat') as stat_file:
+            stat = stat_file.read()
+        # starttime is the 22nd field, the 20th after the parenthesised command name
+        start_ticks = int(stat.rsplit(')', 1)[1].split()[19])
+        started_since_boot = start_ticks / os.sysconf('SC_CLK_TCK')
+        now_since_boot = time.clock_gettime(time.CLOCK_BOOTTIME)
+        return time.monotonic() - (now_since_boot - started_since_boot)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupReport(object):
+    """
+    Records the bootstrap startup phases on the time.monotonic() clock.
+
+    Each call to end_phase() closes a phase that started where the previous
+    one ended. The report is emitted once, when the first invocation has been
+    received, to stderr (KLR_STARTUP_REPORT) and/or to a file
+    (KLR_STARTUP_REPORT_FILE, where "{pid}" is replaced by the process id).
+    """
+
+    def __init__(self, bootstrap_loaded_at):
+        self.process_started_at = None
+        self.bootstrap_loaded_at = bootstrap_loaded_at
+        self.phases = []
+        self.first_invocation_at = None
+        self.to_stderr = False
+        self.report_file = None
+        self._phase_started_at = bootstrap_loaded_at
+
+    def configure(self):
+        self.to_stderr = is_env_flag_set('KLR_STARTUP_REPORT')
+        self.report_file = os.environ.get('KLR_STARTUP_REPORT_FILE') or None
+        if self.to_stderr or self.report_file:
+            self.process_started_at = get_process_start_time()
+
+    @property
+    def enabled(self):
+        return self.to_stderr or self.report_file is not None
+
+    def end_phase(self, name):
+        now = time.monotonic()
+        self.phases.append((name, self._phase_started_at, now))
+        self._phase_started_at = now
+
+    def record_first_invocation(self):
+        if self.first_invocation_at is not None:
+            return
+        self.first_invocation_at = time.monotonic()
+        self.end_phase('wait_first_invocation')
+        if self.enabled:
+            self.emit()
+
+    def as_dict(self):
+        origin = self.process_started_at if self.process_started_at is not None else self.bootstrap_loaded_at
+        report = {
+            'pid': os.getpid(),
+            'process_start': self.process_started_at,
+            'bootstrap_loaded': self.bootstrap_loaded_at,
+            'interpreter_start_ms': None,
+            'phases': [{'name': name, 'start': start, 'end': end, 'duration_ms': round((end - start) * 1000, 3)}
+                       for name, start, end in self.phases],
+            'first_invocation': self.first_invocation_at,
+            'time_to_first_invocation_ms': None,
+        }
+        if self.process_started_at is not None:
+            report['interpreter_start_ms'] = round((self.bootstrap_loaded_at - self.process_started_at) * 1000, 3)
+        if self.first_invocation_at is not None:
+            report['time_to_first_invocation_ms'] = round((self.first_invocation_at - origin) * 1000, 3)
+        return report
+
+    def emit(self):
+        report = self.as_dict()
+        if self.to_stderr:
+            log_runtime_event('init.startup_report', **report)
+        if self.report_file:
+            try:
+                with open(self.report_file.replace('{pid}', str(os.getpid())), 'w') as report_file:
+                    report_file.write(to_json(report))
+            except OSError as e:
+                log_runtime_event('init.startup_report_error', error=str(e))
+
+
+_STARTUP_REPORT = StartupReport(_BOOTSTRAP_LOADED_AT)
+
+
+class Warmup(object):
+    """
+    Opt-in warm-up stage that runs before the first Runtime API poll.
+
+    The handler module's warmup() (or init()) hook is called, then the
+    synthetic KLR_WARMUP_EVENT, inline JSON or a path to a file, is decoded
+    like an invocation event for the handler's mode and passed to the
+    handler with a regular LambdaContext. Results are discarded and
+    failures are only logged.
+    """
+    HOOK_NAMES = ('warmup', 'init')
+    WARMUP_REQUEST_ID = 'warmup'
+    WARMUP_TIMEOUT_MS = 60000
+
+    def __init__(self, hook, event_body, event_error=None):
+        self.hook = hook
+        self.event_body = event_body
+        self.event_error = event_error
+
+    @classmethod
+    def from_environment(cls, handler):
+        warmup_event = os.environ.get('KLR_WARMUP_EVENT')
+        if not warmup_event and not is_env_flag_set('KLR_WARMUP'):
+            return None
+
+        hook = None
+        module = sys.modules.get(handler.rsplit('.', 1)[0])
+        for hook_name in cls.HOOK_NAMES:
+            if callable(getattr(module, hook_name, None)):
+                hook = getattr(module, hook_name)
+                break
+
+        event_body, event_error = None, None
+        if warmup_event:
+            try:
+                if warmup_event.lstrip()[:1] in ('{', '[', '"'):
+                    event_body = warmup_event.encode('utf-8')
+                else:
+                    with open(warmup_event, 'rb') as event_file:
+                        event_body = event_file.read()
+            except OSError as e:
+                event_error = 'Unable to load warm-up event: {}'.format(e)
+        return cls(hook, event_body, event_error)
+
+    def make_context(self):
+        deadline_time_in_ms = int(time.time() * 1000) + self.WARMUP_TIMEOUT_MS
+        return LambdaContext(self.WARMUP_REQUEST_ID, None, None, None, deadline_time_in_ms)
+
+    def make_invocation_args(self, request_handler, batch=False):
+        event = decode_event_body(self.event_body, get_handler_mode(request_handler), get_lazy_event_key(request_handler))
+        if batch:
+            return ([(event, self.make_context())],)
+        return event, self.make_context()
+
+    def _report(self, started_at, errors):
+        log_runtime_event('init.warmup',
+                          hook=self.hook.__name__ if self.hook is not None else None,
+                          event=self.event_body is not None,
+                          duration_ms=round((time.monotonic() - started_at) * 1000, 3),
+                          errors=errors)
+        _STARTUP_REPORT.end_phase('warmup')
+
+    def run(self, request_handler, batch=False):
+        started_at = time.monotonic()
+        errors = [self.event_error] if self.event_error else []
+        if self.hook is not None:
+            try:
+                self.hook()
+            except Exception as e:
+                errors.append('{}: {}'.format(type(e).__name__, e))
+        if self.event_body is not None:
+            try:
+                result = request_handler(*self.make_invocation_args(request_handler, batch))
+                if is_result_stream(result):
+                    for _ in result:
+                        pass
+            except Exception as e:
+                errors.append('{}: {}'.format(type(e).__name__, e))
+        self._report(started_at, errors)
+
+    async def run_async(self, request_handler):
+        started_at = time.monotonic()
+        errors = [self.event_error] if self.event_error else []
+        if self.hook is not None:
+            try:
+                result = self.hook()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                errors.append('{}: {}'.format(type(e).__name__, e))
+        if self.event_body is not None:
+            try:
+                result = request_handler(*self.make_invocation_args(request_handler))
+                if inspect.isawaitable(result):
+                    result = await result
+                if isinstance(result, collections.abc.AsyncIterator):
+                    async for _ in result:
+                        pass
+                elif is_result_stream(result):
+                    for _ in result:
+                        pass
+            except Exception as e:
+                errors.append('{}: {}'.format(type(e).__name__, e))
+        self._report(started_at, errors)
+
+
+class InvocationTimeout(BaseException):
+    """
+    Raised when an invocation runs into its deadline. It derives from
+    BaseException so that `except Exception` in handlers doesn't swallow it.
+    """
+
+
+class DeadlineEnforcer(object):
+    """
+    Enforces the Lambda-Runtime-Deadline-Ms of invocations.
+
+    Invocations whose deadline has already passed are rejected before the
+    handler is called. A sync handler running on the main thread is
+    interrupted by SIGALRM raising InvocationTimeout at the deadline, unless
+    the function installed a SIGALRM handler of its own, and an awaitable is
+    cancelled by asyncio.wait_for(). If an invocation is still
+    running `grace` seconds after its deadline anyway, e.g. because the
+    handler is blocked in C code or swallowed the timeout, a watchdog
+    thread posts timeout errors for the unfinished invocations and exits the
+    process so that it gets replaced.
+    """
+
+    def __init__(self, lambda_runtime_api_addr, grace, use_signals=True):
+        self.lambda_runtime_api_addr = lambda_runtime_api_addr
+        self.grace = grace
+        # SIGALRM is handled on the main thread, so it can only interrupt handlers running there
+        self.use_signals = use_signals and threading.current_thread() is threading.main_thread()
+        if self.use_signals and signal.getsignal(signal.SIGALRM) is not signal.SIG_DFL:
+            # the function uses SIGALRM itself, its handler and timer are left alone
+            self.use_signals = False
+        self._recycle_at = {}
+        self._condition = threading.Condition()
+        self._watchdog = threading.Thread(target=self._watch, name='deadline-watchdog', daemon=True)
+        self._watchdog.start()
+        if self.use_signals:
+            signal.signal(signal.SIGALRM, self._interrupt)
+
+    @staticmethod
+    def _interrupt(signum, frame):
+        raise InvocationTimeout("Handler was interrupted at the invocation deadline")
+
+    @staticmethod
+    def check_deadline(epoch_deadline_time_in_ms):
+        remaining = epoch_deadline_time_in_ms / 1000.0 - time.time()
+        if remaining <= 0:
+            raise InvocationTimeout("Invocation deadline passed {} ms before the handler was called".format(int(-remaining * 1000)))
+        return remaining
+
+    def call(self, epoch_deadline_time_in_ms, function, *args):
+        remaining = self.check_deadline(epoch_deadline_time_in_ms)
+        if not self.use_signals or signal.getsignal(signal.SIGALRM) is not self._interrupt:
+            # e.g. the function installed its own SIGALRM handler since
+            return function(*args)
+        signal.setitimer(signal.ITIMER_REAL, remaining)
+        try:
+            return function(*args)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    async def call_async(self, epoch_deadline_time_in_ms, function, *args):
+        remaining = self.check_deadline(epoch_deadline_time_in_ms)
+        result = function(*args)
+        if not inspect.isawaitable(result):
+            # async generator handlers are covered by the watchdog only
+            return result
+        try:
+            return await asyncio.wait_for(result, remaining)
+        except asyncio.TimeoutError:
+            raise InvocationTimeout("Handler was cancelled at the invocation deadline")
+
+    def start_invocation(self, invoke_id, epoch_deadline_time_in_ms):
+        # invocations that arrive already expired get the grace period to be rejected
+        recycle_at = max(epoch_deadline_time_in_ms / 1000.0, time.time()) + self.grace
+        with self._condition:
+            self._recycle_at[invoke_id] = recycle_at
+            self._condition.notify()
+
+    def finish_invocation(self, invoke_id):
+        with self._condition:
+            self._recycle_at.pop(invoke_id, None)
+
+    def _watch(self):
+        with self._condition:
+            while True:
+                if not self._recycle_at:
+                    self._condition.wait()
+                    continue
+                delay = min(self._recycle_at.values()) - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                # keeps the lock, so finish_invocation() blocks until the process exits
+                self._recycle()
+
+    def _recycle(self):
+        invoke_ids = list(self._recycle_at)
+        log_runtime_event('invocation.deadline_recycle',
+                          level='ERROR',
+                          invoke_ids=invoke_ids,
+                          grace_ms=int(self.grace * 1000))
+        try:
+            flush_log_output()
+            lambda_runtime_client = LambdaRuntimeClient(self.lambda_runtime_api_addr, pool_size=1, max_retries=0)
+            for invoke_id in invoke_ids:
+                error = InvocationTimeout("Handler did not stop within {} ms after the invocation deadline, the runtime process was recycled".format(int(self.grace * 1000)))
+                lambda_runtime_client.post_invocation_error(invoke_id, build_error_result(invoke_id, error))
+        except Exception as e:
+            log_runtime_event('invocation.deadline_recycle_error', level='ERROR', error='{}: {}'.format(type(e).__name__, e))
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(1)
+
+
+_DEADLINE_ENFORCER = None
+
+
+def set_deadline_enforcer(deadline_enforcer):
+    global _DEADLINE_ENFORCER
+    _DEADLINE_ENFORCER = deadline_enforcer
+
+
+def read_memory_status():
+    """Returns the current (VmRSS) and peak (VmHWM) resident set size of this process in bytes."""
+    rss = hwm = 0
+    with open('/proc/self/status', 'rb') as status:
+        for line in status:
+            if line.startswith(b'VmRSS:'):
+                rss = int(line.split()[1]) * 1024
+            elif line.startswith(b'VmHWM:'):
+                hwm = int(line.split()[1]) * 1024
+    return rss, hwm
+
+
+class MemoryWatchdog(object):
+    """
+    Recycles the process before it is OOM-killed in the middle of an invocation.
+
+    The resident set size is sampled after every invocation, once its
+    result has been posted, and the invocation loop stops taking new
+    invocations when it exceeds `threshold` of `limit` bytes, so the process
+    exits between invocations and gets replaced. The peak resident set size
+    is reset before each invocation, so the high-water mark of every
+    invocation is known as well.
+
+    When tracemalloc is tracing, the allocation sites that grew most since
+    the previous snapshot are logged every `tracemalloc_interval`
+    invocations.
+    """
+
+    def __init__(self, limit, threshold, tracemalloc_top=0, tracemalloc_interval=100):
+        self.limit = limit
+        self.threshold = threshold
+        self.tracemalloc_top = tracemalloc_top
+        self.tracemalloc_interval = tracemalloc_interval
+        self.invocations = 0
+        self.peak_invocation_hwm = 0
+        self.recycling = False
+        self._reset_hwm = True
+        self._snapshot = None
+        # invocations finish on several threads with KLR_THREADS
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        threshold = os.environ.get('KLR_MEMORY_RECYCLE_THRESHOLD')
+        tracemalloc_top = get_tracemalloc_top()
+        if threshold is None and tracemalloc_top <= 0:
+            return None
+        limit = None
+        if threshold is not None:
+            threshold = float(threshold)
+            if not 0 < threshold <= 1:
+                raise ValueError("KLR_MEMORY_RECYCLE_THRESHOLD must be a fraction between 0 and 1, got {}".format(threshold))
+            memory_size = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+            if not memory_size:
+                raise ValueError("KLR_MEMORY_RECYCLE_THRESHOLD requires AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+            limit = int(memory_size) * 1024 * 1024
+        tracemalloc_interval = int(os.environ.get('KLR_TRACEMALLOC_INTERVAL', '100'))
+        if tracemalloc_interval < 1:
+            raise ValueError("KLR_TRACEMALLOC_INTERVAL must be a positive integer, got {}".format(tracemalloc_interval))
+        return cls(limit, threshold, tracemalloc_top, tracemalloc_interval)
+
+    def before_invocation(self):
+        if not self._reset_hwm:
+            return
+        try:
+            # "5" resets VmHWM to the current VmRSS
+            with open('/proc/self/clear_refs', 'w') as clear_refs:
+                clear_refs.write('5')
+        except OSError:
+            self._reset_hwm = False
+
+    def after_invocation(self):
+        """Returns True when the process should stop taking invocations."""
+        with self._lock:
+            return self._after_invocation()
+
+    def _after_invocation(self):
+        self.invocations += 1
+        if self.tracemalloc_top > 0 and self.invocations % self.tracemalloc_interval == 0:
+            self.log_tracemalloc_top()
+        if self.limit is None:
+            return False
+
+        rss, hwm = read_memory_status()
+        self.peak_invocation_hwm = max(self.peak_invocation_hwm, hwm)
+        if not self.recycling and rss >= self.threshold * self.limit:
+            self.recycling = True
+            log_runtime_event('memory.recycle',
+                              rss_mb=round(rss / 1048576.0, 1),
+                              invocation_hwm_mb=round(hwm / 1048576.0, 1),
+                              peak_invocation_hwm_mb=round(self.peak_invocation_hwm / 1048576.0, 1),
+                              limit_mb=self.limit // 1048576,
+                              threshold=self.threshold,
+                              invocations=self.invocations)
+        return self.recycling
+
+    def log_tracemalloc_top(self):
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ))
+        if self._snapshot is not None:
+            stats = snapshot.compare_to(self._snapshot, 'lineno')
+        else:
+            stats = snapshot.statistics('lineno')
+        self._snapshot = snapshot
+
+        top = []
+        for stat in stats[:self.tracemalloc_top]:
+            frame = stat.traceback[0]
+            top.append({
+                'location': '{}:{}'.format(frame.filename, frame.lineno),
+                'size_kb': round(stat.size / 1024.0, 1),
+                'size_diff_kb': round(getattr(stat, 'size_diff', stat.size) / 1024.0, 1),
+                'count': stat.count,
+            })
+        log_runtime_event('memory.tracemalloc_top', invocations=self.invocations, top=top)
+
+
+_MEMORY_WATCHDOG = None
+
+
+def set_memory_watchdog(memory_watchdog):
+    global _MEMORY_WATCHDOG
+    _MEMORY_WATCHDOG = memory_watchdog
+
+
+class StackSampler(object):
+    """
+    Low-overhead profiler that samples the stack of one thread every
+    `interval` seconds from a background thread and counts the distinct
+    stacks, in the collapsed format of flame graph tools.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def write(self, path):
+        with open(path, 'w') as collapsed:
+            for stack, count in sorted(self.stacks.items()):
+                collapsed.write('{} {}\n'.format(stack, count))
+
+
+class InvocationProfiler(object):
+    """
+    Profiles selected invocations, including the runtime's decoding,
+    encoding and posting of the result, and writes one file per invocation
+    named after its aws_request_id to `directory`.
+
+    The first `count` invocations are profiled, then every `every`th one,
+    and SIGUSR2 profiles the next `count` (at least one). `mode` is
+    "cprofile" for pstats files or "sample" for collapsed stacks sampled
+    every `sample_interval` seconds.
+    """
+    PROFILER_MODES = ('cprofile', 'sample')
+
+    def __init__(self, directory, count=0, every=0, mode='cprofile', sample_interval=0.005):
+        self.directory = directory
+        self.count = count
+        self.every = every
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.invocations = 0
+        self.armed = count
+        # reentrant, as arm() runs in a signal handler on the main thread
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_environment(cls):
+        directory = os.environ.get('KLR_PROFILE_DIR')
+        if not directory:
+            return None
+        mode = os.environ.get('KLR_PROFILER', 'cprofile')
+        if mode not in cls.PROFILER_MODES:
+            raise ValueError("KLR_PROFILER must be one of {}, got {!r}".format(', '.join(cls.PROFILER_MODES), mode))
+        return cls(directory,
+                   int(os.environ.get('KLR_PROFILE_COUNT', '0')),
+                   int(os.environ.get('KLR_PROFILE_EVERY', '0')),
+                   mode,
+                   float(os.environ.get('KLR_PROFILE_INTERVAL_MS', '5')) / 1000.0)
+
+    def arm(self, signum=None, frame=None):
+        with self._lock:
+            self.armed += max(self.count, 1)
+
+    def should_profile(self):
+        with self._lock:
+            self.invocations += 1
+            if self.armed > 0:
+                self.armed -= 1
+                return True
+            return self.every > 0 and self.invocations % self.every == 0
+
+    @contextlib.contextmanager
+    def profile(self, aws_request_id):
+        if not self.should_profile():
+            yield
+            return
+
+        started_at = time.monotonic()
+        if self.mode == 'sample':
+            profiler = StackSampler(threading.get_ident(), self.sample_interval)
+            path = os.path.join(self.directory, '{}.collapsed'.format(aws_request_id))
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                self._write(profiler.write, path, aws_request_id, started_at)
+        else:
+            profiler = cProfile.Profile()
+            path = os.path.join(self.directory, '{}.pstats'.format(aws_request_id))
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self._write(profiler.dump_stats, path, aws_request_id, started_at)
+
+    def _write(self, write, path, aws_request_id, started_at):
+        duration_ms = round((time.monotonic() - started_at) * 1000, 3)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write(path)
+        except OSError as e:
+            log_runtime_event('profile.error', level='WARNING', aws_request_id=aws_request_id, error=str(e))
+            return
+        log_runtime_event('profile.written', aws_request_id=aws_request_id, path=path, duration_ms=duration_ms)
+
+
+_INVOCATION_PROFILER = None
+
+
+def set_invocation_profiler(invocation_profiler):
+    global _INVOCATION_PROFILER
+    _INVOCATION_PROFILER = invocation_profiler
+    if invocation_profiler is not None:
+        signal.signal(signal.SIGUSR2, invocation_profiler.arm)
+
+
+def profile_invocation(aws_request_id):
+    if _INVOCATION_PROFILER is None:
+        return contextlib.nullcontext()
+    return _INVOCATION_PROFILER.profile(aws_request_id)
+
+
+_METRICS = None
+
+
+def set_metrics(metrics):
+    global _METRICS
+    _METRICS = metrics
+
+
+def start_stage_timer():
+    if _METRICS is None:
+        return NULL_STAGE_TIMER
+    return _METRICS.stage_timer()
+
+
+def make_metrics_from_environment():
+    address = os.environ.get('KLR_METRICS_ADDR')
+    path = os.environ.get('KLR_METRICS_FILE')
+    if not address and not path:
+        return None
+
+    metrics = RuntimeMetrics()
+    if address:
+        try:
+            serve_metrics(metrics, address)
+        except OSError as e:
+            # e.g. another bootstrap process of the pod is serving the address already
+            log_runtime_event('metrics.error', level='WARNING', address=address, error=str(e))
+    if path:
+        path = path.replace('{pid}', str(os.getpid()))
+        write_metrics_periodically(metrics, path, get_metrics_file_interval())
+    return metrics
+
+
+def run_invocation_loop(lambda_runtime_client, request_handler, invocation_source=None):
+    # results are always posted through lambda_runtime_client, the next event
+    # may come from a different source such as an InvocationPrefetcher
+    if invocation_source is None:
+        invocation_source = lambda_runtime_client
+
+    while True:
+        stage_timer = start_stage_timer()
+        event_request = invocation_source.wait_next_invocation()
+        if event_request is None:
+            # the source is stopped, e.g. a prefetcher whose invocations are all handled
+            return
+        stage_timer.lap('wait_next')
+        _STARTUP_REPORT.record_first_invocation()
+
+        start_request_context(event_request)
+
+        if _DEADLINE_ENFORCER is not None:
+            _DEADLINE_ENFORCER.start_invocation(event_request.invoke_id, event_request.deadline_time_in_ms)
+        if _MEMORY_WATCHDOG is not None:
+            _MEMORY_WATCHDOG.before_invocation()
+        with profile_invocation(event_request.invoke_id):
+            handle_event_request(lambda_runtime_client,
+                                 request_handler,
+                                 event_request.invoke_id,
+                                 event_request.event_body,
+                                 event_request.client_context,
+                                 event_request.cloudevents_context,
+                                 event_request.cognito_identity,
+                                 event_request.invoked_function_arn,
+                                 event_request.deadline_time_in_ms,
+                                 event_request.release_event_body,
+                                 stage_timer)
+        if _DEADLINE_ENFORCER is not None:
+            _DEADLINE_ENFORCER.finish_invocation(event_request.invoke_id)
+        if _MEMORY_WATCHDOG is not None and _MEMORY_WATCHDOG.after_invocation():
+            if not isinstance(invocation_source, InvocationPrefetcher):
+                return
+            # the invocations it fetched already are handled before returning
+            invocation_source.stop()
+
+
+def run_batch_invocation_loop(lambda_runtime_client, request_handler, batch_size, batch_linger, batch_max_bytes):
+    # the prefetcher keeps up to batch_size invocations queued, a batch is
+    # whatever is queued within batch_linger seconds of its first invocation
+    invocation_prefetcher = InvocationPrefetcher(lambda_runtime_client, depth=batch_size)
+
+    while True:
+        stage_timer = start_stage_timer()
+        event_request = invocation_prefetcher.wait_next_invocation()
+        if event_request is None:
+            # the prefetcher is stopped and every invocation it fetched is handled
+            return
+        event_requests = [event_request]
+        _STARTUP_REPORT.record_first_invocation()
+
+        batch_bytes = len(event_requests[0].event_body)
+        linger_until = time.monotonic() + batch_linger
+        while len(event_requests) < batch_size and batch_bytes < batch_max_bytes:
+            linger = linger_until - time.monotonic()
+            if linger <= 0:
+                break
+            event_request = invocation_prefetcher.wait_next_invocation(timeout=linger)
+            if event_request is None:
+                break
+            event_requests.append(event_request)
+            batch_bytes += len(event_request.event_body)
+        stage_timer.lap('wait_next')
+
+        # NOTE: the handler is called once for the whole batch, so the
+        # request context is the one of its first invocation
+        start_request_context(event_requests[0])
+
+        if _DEADLINE_ENFORCER is not None:
+            for event_request in event_requests:
+                _DEADLINE_ENFORCER.start_invocation(event_request.invoke_id, event_request.deadline_time_in_ms)
+        if _MEMORY_WATCHDOG is not None:
+            _MEMORY_WATCHDOG.before_invocation()
+        with profile_invocation(event_requests[0].invoke_id):
+            handle_event_batch(lambda_runtime_client, request_handler, event_requests, stage_timer)
+        if _DEADLINE_ENFORCER is not None:
+            for event_request in event_requests:
+                _DEADLINE_ENFORCER.finish_invocation(event_request.invoke_id)
+        if _MEMORY_WATCHDOG is not None and _MEMORY_WATCHDOG.after_invocation():
+            # the invocations it fetched already are handled in further batches
+            invocation_prefetcher.stop()
+
+
+class InvocationThreadPool(object):
+    """
+    Handles invocations of a sync handler on `thread_count` threads. Every
+    thread long-polls on its own Runtime API connection and runs
+    run_invocation_loop(), so up to `thread_count` invocations are in flight
+    in one process.
+
+    Once the memory watchdog recycles the process, the polls of the idle
+    threads are interrupted and run() returns when every thread has
+    finished the invocation it took. An error that stops a thread is raised
+    by run().
+    """
+
+    def __init__(self, lambda_runtime_api_addr, request_handler, thread_count):
+        self.lambda_runtime_api_addr = lambda_runtime_api_addr
+        self.request_handler = request_handler
+        self.thread_count = thread_count
+        self._condition = threading.Condition()
+        self._lambda_runtime_clients = []
+        self._stopped = False
+        self._error = None
+
+    def run(self):
+        threads = []
+        for index in range(self.thread_count):
+            thread = threading.Thread(target=self._run_thread, name='invocation-{}'.format(index), daemon=True)
+            thread.start()
+            threads.append(thread)
+        with self._condition:
+            while self._error is None and not self._stopped:
+                self._condition.wait()
+            if self._error is not None:
+                raise self._error
+            # threads that took an invocation handle it, the others stop polling
+            for lambda_runtime_client in self._lambda_runtime_clients:
+                lambda_runtime_client.interrupt_wait()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run_thread(self):
+        try:
+            # a failed connect is raised by run() too
+            lambda_runtime_client = LambdaRuntimeClient(self.lambda_runtime_api_addr, pool_size=1)
+            with self._condition:
+                if self._stopped:
+                    lambda_runtime_client.interrupt_wait()
+                self._lambda_runtime_clients.append(lambda_runtime_client)
+            run_invocation_loop(lambda_runtime_client, self.request_handler, _PoolInvocationSource(lambda_runtime_client))
+            with self._condition:
+                self._stopped = True
+                self._condition.notify()
+        except BaseException as e:
+            with self._condition:
+                if self._error is None:
+                    self._error = e
+                self._condition.notify()
+
+
+class _PoolInvocationSource(object):
+    # the poll of an idle thread is interrupted when the pool stops
+    def __init__(self, lambda_runtime_client):
+        self.lambda_runtime_client = lambda_runtime_client
+
+    def wait_next_invocation(self):
+        try:
+            return self.lambda_runtime_client.wait_next_invocation()
+        except RequestInterrupted:
+            return None
+
+
+async def run_async_invocation_worker(lambda_runtime_client, request_handler, polling_tasks):
+    while _MEMORY_WATCHDOG is None or not _MEMORY_WATCHDOG.recycling:
+        polling_task = asyncio.current_task()
+        polling_tasks.add(polling_task)
+        stage_timer = start_stage_timer()
+        try:
+            event_request = await lambda_runtime_client.wait_next_invocation()
+        except asyncio.CancelledError:
+            if _MEMORY_WATCHDOG is not None and _MEMORY_WATCHDOG.recycling:
+                return
+            raise
+        finally:
+            polling_tasks.discard(polling_task)
+        stage_timer.lap('wait_next')
+        _STARTUP_REPORT.record_first_invocation()
+
+        # every worker task runs in its own copy of the context
+        start_request_context(event_request)
+
+        if _DEADLINE_ENFORCER is not None:
+            _DEADLINE_ENFORCER.start_invocation(event_request.invoke_id, event_request.deadline_time_in_ms)
+        if _MEMORY_WATCHDOG is not None:
+            _MEMORY_WATCHDOG.before_invocation()
+        # NOTE: with more than one invocation in flight a profile also
+        # covers whatever the other invocations run on the event loop
+        with profile_invocation(event_request.invoke_id):
+            await handle_event_request_async(lambda_runtime_client,
+                                             request_handler,
+                                             event_request.invoke_id,
+                                             event_request.event_body,
+                                             event_request.client_context,
+                                             event_request.cloudevents_context,
+                                             event_request.cognito_identity,
+                                             event_request.invoked_function_arn,
+                                             event_request.deadline_time_in_ms,
+                                             stage_timer)
+        if _DEADLINE_ENFORCER is not None:
+            _DEADLINE_ENFORCER.finish_invocation(event_request.invoke_id)
+        if _MEMORY_WATCHDOG is not None and _MEMORY_WATCHDOG.after_invocation():
+            # workers that are handling an invocation finish it, idle ones stop polling
+            for polling_task in list(polling_tasks):
+                polling_task.cancel()
+
+
+async def run_async_invocation_loop(lambda_runtime_api_addr, request_handler, concurrency):
+    # every worker long-polls on its own connection, so up to `concurrency`
+    # invocations are handled concurrently on this event loop
+    warmup = Warmup.from_environment(os.environ['_HANDLER'])
+    if warmup is not None:
+        await warmup.run_async(request_handler)
+
+    lambda_runtime_clients = [AsyncLambdaRuntimeClient(lambda_runtime_api_addr) for _ in range(concurrency)]
+    polling_tasks = set()
+    try:
+        await asyncio.gather(*[run_async_invocation_worker(lambda_runtime_client, request_handler, polling_tasks)
+                               for lambda_runtime_client in lambda_runtime_clients])
+    finally:
+        for lambda_runtime_client in lambda_runtime_clients:
+            lambda_runtime_client.close()
+
+
+def run_worker(lambda_runtime_client, lambda_runtime_api_addr, request_handler, async_concurrency):
+    thread_count = 1 if is_async_handler(request_handler) else get_thread_count()
+    if is_deadline_enforced():
+        # handlers running on the pool threads are covered by the watchdog only
+        set_deadline_enforcer(DeadlineEnforcer(lambda_runtime_api_addr, get_deadline_grace_ms() / 1000.0, use_signals=thread_count == 1))
+    set_memory_watchdog(MemoryWatchdog.from_environment())
+    set_invocation_profiler(InvocationProfiler.from_environment())
+    set_metrics(make_metrics_from_environment())
+    concurrent_invocations = thread_count > 1 or (is_async_handler(request_handler) and async_concurrency > 1)
+    set_serial_invocations(not concurrent_invocations)
+    set_trace_env_compat(is_trace_env_compat_enabled(concurrent_invocations))
+
+    if is_async_handler(request_handler):
+        lambda_runtime_client.close()
+        asyncio.run(run_async_invocation_loop(lambda_runtime_api_addr, request_handler, async_concurrency))
+        return
+
+    batch_size = get_batch_size()
+    warmup = Warmup.from_environment(os.environ['_HANDLER'])
+    if warmup is not None:
+        if batch_size > 1:
+            warmup.run(request_handler, batch=True)
+        else:
+            warmup.run(request_handler)
+
+    if thread_count > 1:
+        # every thread opens its own connection
+        lambda_runtime_client.close()
+        InvocationThreadPool(lambda_runtime_api_addr, request_handler, thread_count).run()
+    elif batch_size > 1:
+        run_batch_invocation_loop(lambda_runtime_client, request_handler, batch_size, get_batch_linger_ms() / 1000.0, get_batch_max_bytes())
+    elif is_prefetch_enabled():
+        invocation_prefetcher = InvocationPrefetcher(lambda_runtime_client)
+        run_invocation_loop(lambda_runtime_client, request_handler, invocation_prefetcher)
+    else:
+        run_invocation_loop(lambda_runtime_client, request_handler)
+
+
+PR_SET_PDEATHSIG = 1
+
+
+def exit_with_parent(parent_pid):
+    """Sends SIGTERM to the calling process once its parent process is gone."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.prctl(PR_SET_PDEATHSIG, signal.SIGTERM, 0, 0, 0) != 0:
+            raise OSError(ctypes.get_errno(), 'prctl(PR_SET_PDEATHSIG) failed')
+    except (OSError, AttributeError):
+        # not Linux, the parent is polled instead
+        threading.Thread(target=watch_parent, args=(parent_pid,), name='parent-watch', daemon=True).start()
+        return
+    if os.getppid() != parent_pid:
+        # the parent died before prctl()
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+def watch_parent(parent_pid):
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def fork_worker(lambda_runtime_api_addr, request_handler, async_concurrency):
+    parent_pid = os.getpid()
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    # worker process: never returns into the supervisor loop
+    exit_code = 0
+    try:
+        signal.signal(signal.SIGTERM, exit_on_signal)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+        # the worker would keep taking invocations if the supervisor was
+        # killed, e.g. by the OOM killer, as it holds the largest heap
+        exit_with_parent(parent_pid)
+        gc.enable()
+        _STARTUP_REPORT.end_phase('fork_worker')
+        lambda_runtime_client = LambdaRuntimeClient(lambda_runtime_api_addr)
+        run_worker(lambda_runtime_client, lambda_runtime_api_addr, request_handler, async_concurrency)
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+def run_prefork_supervisor(lambda_runtime_api_addr, request_handler, async_concurrency, worker_count):
+    # everything allocated during init (handler module and its dependencies)
+    # is moved to the permanent generation, so collections in the workers
+    # do not write to, and thereby un-share, the inherited pages
+    gc.freeze()
+
+    workers = {}
+    shutting_down = []
+
+    def shutdown(signum, frame):
+        shutting_down.append(signum)
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def forward(signum, frame):
+        for pid in list(workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    if os.environ.get('KLR_PROFILE_DIR'):
+        # profiling is triggered in every worker
+        signal.signal(signal.SIGUSR2, forward)
+
+    for _ in range(worker_count):
+        workers[fork_worker(lambda_runtime_api_addr, request_handler, async_concurrency)] = time.monotonic()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started_at = workers.pop(pid, None)
+        if started_at is None or shutting_down:
+            continue
+
+        log_runtime_event('prefork.worker_exit', pid=pid, status=status, uptime=round(time.monotonic() - started_at, 3))
+        if time.monotonic() - started_at < 1:
+            # do not spin when workers die right after start
+            time.sleep(1)
+        if shutting_down:
+            continue
+        pid = fork_worker(lambda_runtime_api_addr, request_handler, async_concurrency)
+        workers[pid] = time.monotonic()
+        if shutting_down:
+            # the signal arrived while the worker was being forked
+            os.kill(pid, signal.SIGTERM)
+
+    if shutting_down:
+        flush_log_output()
+        sys.exit(128 + shutting_down[0])
 
 
 def main():
-    sys.stdout = Unbuffered(sys.stdout)
-    sys.stderr = Unbuffered(sys.stderr)
+    log_pipeline = None
+    if is_log_buffering_enabled():
+        try:
+            log_pipeline = LogPipeline(get_log_flush_interval_ms() / 1000, get_log_buffer_bytes())
+        except ValueError:
+            # reported as an init error below, with unbuffered output
+            pass
+    if log_pipeline is not None:
+        try:
+            # keeps the lines printed by concurrent threads apart
+            line_atomic = get_thread_count() > 1
+        except ValueError:
+            # reported as an init error below
+            line_atomic = False
+        sys.stdout = log_pipeline.stream(sys.stdout, line_atomic)
+        sys.stderr = log_pipeline.stream(sys.stderr, line_atomic)
+        atexit.register(log_pipeline.flush)
+    else:
+        sys.stdout = Unbuffered(sys.stdout)
+        sys.stderr = Unbuffered(sys.stderr)
+    signal.signal(signal.SIGTERM, exit_on_signal)
+    _STARTUP_REPORT.configure()
+    _STARTUP_REPORT.end_phase('configure_output')
 
     lambda_runtime_api_addr = os.environ['AWS_LAMBDA_RUNTIME_API']
     del os.environ['AWS_LAMBDA_RUNTIME_API']
     lambda_runtime_client = LambdaRuntimeClient(lambda_runtime_api_addr)
+    _STARTUP_REPORT.end_phase('connect_runtime_api')
 
     try:
+        prefork_workers = get_prefork_workers()
+        if prefork_workers > 0:
+            # avoid leaving freed holes in pages that are shared with the workers
+            gc.disable()
+
+        if is_log_buffering_enabled():
+            log_flush_interval_ms = get_log_flush_interval_ms()
+            if log_flush_interval_ms < 0:
+                raise ValueError("KLR_LOG_FLUSH_INTERVAL_MS must not be negative, got {}".format(log_flush_interval_ms))
+            get_log_buffer_bytes()
+
         set_path_env_variable()
+        _STARTUP_REPORT.end_phase('set_path_env_variable')
         set_ld_library_path_variable()
+        _STARTUP_REPORT.end_phase('set_ld_library_path_variable')
 
         logging.Formatter.converter = time.gmtime
         logger = logging.getLogger()
         logger_handler = LambdaLoggerHandler()
-        logger_handler.setFormatter(logging.Formatter(
-            '[%(levelname)s]\t%(asctime)s.%(msecs)dZ\t%(aws_request_id)s\t%(message)s\n',
-            '%Y-%m-%dT%H:%M:%S'
-        ))
+        if get_log_format() == LOG_FORMAT_JSON:
+            logger_handler.setFormatter(JsonLogFormatter())
+        else:
+            logger_handler.setFormatter(logging.Formatter(
+                '[%(levelname)s]\t%(asctime)s.%(msecs)dZ\t%(aws_request_id)s\t%(message)s\n',
+                '%Y-%m-%dT%H:%M:%S'
+            ))
+        log_sample_rates = get_log_sample_rates()
+        if log_sample_rates:
+            # before LambdaLoggerFilter, dropped records cost as little as possible
+            logger_handler.addFilter(LogSamplingFilter(log_sample_rates))
         logger_handler.addFilter(LambdaLoggerFilter())
         logger.addHandler(logger_handler)
+        _STARTUP_REPORT.end_phase('setup_logger')
 
-        global _GLOBAL_AWS_REQUEST_ID
-
-        set_default_sys_path()
-        add_default_site_directories()
+        if load_path_manifest(get_path_manifest_path()):
+            _STARTUP_REPORT.end_phase('load_path_manifest')
+        else:
+            set_default_sys_path()
+            _STARTUP_REPORT.end_phase('set_default_sys_path')
+            add_default_site_directories()
+            _STARTUP_REPORT.end_phase('add_default_site_directories')
 
         handler = os.environ["_HANDLER"]
-        request_handler = _get_handler(handler)
+        check_handler_bytecode(handler)
+        if get_tracemalloc_top() > 0:
+            # started before the handler is imported, so its allocations are traced too
+            tracemalloc.start()
+        # fail init on an invalid configuration
+        if is_deadline_enforced():
+            deadline_grace_ms = get_deadline_grace_ms()
+            if deadline_grace_ms < 0:
+                raise ValueError("KLR_DEADLINE_GRACE_MS must not be negative, got {}".format(deadline_grace_ms))
+        MemoryWatchdog.from_environment()
+        InvocationProfiler.from_environment()
+        import_timings_top = get_import_timings_top()
+        if import_timings_top > 0:
+            with ImportTimer() as import_timer:
+                request_handler = _get_handler(handler)
+            log_runtime_event('init.import_timings',
+                              handler=handler,
+                              modules_imported=len(import_timer.timings),
+                              slowest=import_timer.slowest(import_timings_top))
+        else:
+            request_handler = _get_handler(handler)
+        _STARTUP_REPORT.end_phase('get_handler')
+
+        set_json_codec(make_json_codec(os.environ.get('KLR_JSON_CODEC', 'auto')))
+        set_handler_mode(os.environ.get('KLR_HANDLER_MODE', HANDLER_MODE_JSON))
+        set_lazy_event_key(os.environ.get('KLR_LAZY_EVENT_KEY', 'Records'))
+
+        async_concurrency = get_async_concurrency()
+        if async_concurrency < 1:
+            raise ValueError("KLR_ASYNC_CONCURRENCY must be a positive integer, got {}".format(async_concurrency))
+        batch_size = get_batch_size()
+        if batch_size < 1:
+            raise ValueError("KLR_BATCH_SIZE must be a positive integer, got {}".format(batch_size))
+        if batch_size > 1 and is_async_handler(request_handler):
+            raise ValueError("KLR_BATCH_SIZE is not supported with async handlers, use KLR_ASYNC_CONCURRENCY")
+        if batch_size > 1:
+            batch_linger_ms = get_batch_linger_ms()
+            if batch_linger_ms < 0:
+                raise ValueError("KLR_BATCH_LINGER_MS must not be negative, got {}".format(batch_linger_ms))
+            batch_max_bytes = get_batch_max_bytes()
+            if batch_max_bytes < 1:
+                raise ValueError("KLR_BATCH_MAX_BYTES must be a positive integer, got {}".format(batch_max_bytes))
+        thread_count = get_thread_count()
+        if thread_count < 1:
+            raise ValueError("KLR_THREADS must be a positive integer, got {}".format(thread_count))
+        if thread_count > 1 and is_async_handler(request_handler):
+            raise ValueError("KLR_THREADS is not supported with async handlers, use KLR_ASYNC_CONCURRENCY")
+        if thread_count > 1 and batch_size > 1:
+            raise ValueError("KLR_THREADS and KLR_BATCH_SIZE cannot be combined")
+        metrics_path = os.environ.get('KLR_METRICS_FILE')
+        if metrics_path:
+            metrics_file_interval = get_metrics_file_interval()
+            if metrics_file_interval <= 0:
+                raise ValueError("KLR_METRICS_FILE_INTERVAL must be a positive number, got {}".format(metrics_file_interval))
+        if prefork_workers > 0 or get_invoker_count() > 1:
+            # every process only has metrics of its own invocations
+            if os.environ.get('KLR_METRICS_ADDR'):
+                raise ValueError("KLR_METRICS_ADDR serves the metrics of a single process, "
+                                 "use KLR_METRICS_FILE with {pid} in the path with KLR_PREFORK_WORKERS or INVOKER_COUNT above 1")
+            if metrics_path and '{pid}' not in metrics_path:
+                raise ValueError("KLR_METRICS_FILE needs {pid} in the path with KLR_PREFORK_WORKERS or INVOKER_COUNT above 1")
     except Exception as e:
         result = build_fault_result(None, sys.exc_info(), None)
         result = to_json(result)
 
+        flush_log_output()
         lambda_runtime_client.post_init_error(result)
 
         sys.exit(1)
 
-    while True:
-        event_request = lambda_runtime_client.wait_next_invocation()
+    if prefork_workers > 0:
+        # workers open their own connections after the fork
+        lambda_runtime_client.close()
+        run_prefork_supervisor(lambda_runtime_api_addr, request_handler, async_concurrency, prefork_workers)
+    else:
+        run_worker(lambda_runtime_client, lambda_runtime_api_addr, request_handler, async_concurrency)
 
-        _GLOBAL_AWS_REQUEST_ID = event_request.invoke_id
 
-        update_xray_env_variable(event_request.x_amzn_trace_id)
+def build_main(argv):
+    parser = argparse.ArgumentParser(prog='bootstrap.py', description='Image build helpers of the Python 3.7 runtime.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    path_manifest = commands.add_parser('path-manifest', help='resolve sys.path and .pth files into a manifest loaded at startup')
+    path_manifest.add_argument('--output', default=get_path_manifest_path(), help='manifest file (default: %(default)s)')
+
+    compile_bundle = commands.add_parser('compile', help='precompile the function code and /opt/python layers')
+    compile_bundle.add_argument('--handler', default=os.environ.get('_HANDLER'),
+                                help='handler whose module must compile (default: %(default)s)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'path-manifest':
+        write_path_manifest(args.output)
+    elif args.command == 'compile':
+        if not compile_function_bundle(args.handler):
+            return 1
+    return 0
+
 
-        handle_event_request(lambda_runtime_client,
-                             request_handler,
-                             event_request.invoke_id,
-                             event_request.event_body,
-                             event_request.client_context,
-                             event_request.cloudevents_context,
-                             event_request.cognito_identity,
-                             event_request.invoked_function_arn,
-                             event_request.deadline_time_in_ms)
+if __name__ == '__main__':
+    sys.exit(build_main(sys.argv[1:]))
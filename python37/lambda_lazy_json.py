@@ -0,0 +1,137 @@
+"""
+Incremental decoding of events that carry a large top-level array.
+
+loads_lazy() decodes the top-level object of an event except for one
+array-valued key (for example `Records`), which becomes a LazyJsonArray.
+Iterating it decodes one item at a time from the event text, so the
+first record is available before the rest are decoded and only the
+record being processed has to be kept in memory.
+"""
+
+import json
+import re
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURE = re.compile(r'[\[\]{}"]')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+
+_DECODER = json.JSONDecoder()
+
+
+def _skip_whitespace(text, pos):
+    return _WHITESPACE.match(text, pos).end()
+
+
+def _expect(text, pos, char, message):
+    if text[pos:pos + 1] != char:
+        raise json.JSONDecodeError(message, text, pos)
+    return _skip_whitespace(text, pos + 1)
+
+
+def _skip_value(text, pos):
+    """
+    Returns the position after the JSON value at `pos` without building it.
+    Arrays and objects are only bracket-matched, malformed content inside
+    them is reported when they are decoded.
+    """
+    if text[pos:pos + 1] not in ('[', '{'):
+        return _DECODER.raw_decode(text, pos)[1]
+    depth = 0
+    while True:
+        match = _STRUCTURE.search(text, pos)
+        if match is None:
+            raise json.JSONDecodeError("Unterminated array or object", text, pos)
+        char = match.group()
+        if char == '"':
+            string = _STRING.match(text, match.start())
+            if string is None:
+                raise json.JSONDecodeError("Unterminated string", text, match.start())
+            pos = string.end()
+            continue
+        pos = match.end()
+        depth += 1 if char in '[{' else -1
+        if depth == 0:
+            return pos
+
+
+class LazyJsonArray(object):
+    """
+    A JSON array decoded item by item while it is iterated.
+
+    Every iteration starts its own cursor at the beginning of the array, and
+    items are not kept once they have been yielded. len() counts the items
+    without decoding them.
+    """
+
+    def __init__(self, text, start):
+        self._text = text
+        self._start = start
+        self._length = None
+
+    def __iter__(self):
+        text = self._text
+        pos = _skip_whitespace(text, self._start + 1)
+        if text[pos:pos + 1] == ']':
+            return
+        while True:
+            item, pos = _DECODER.raw_decode(text, pos)
+            yield item
+            pos = _skip_whitespace(text, pos)
+            if text[pos:pos + 1] == ']':
+                return
+            pos = _expect(text, pos, ',', "Expecting ',' delimiter")
+
+    def __len__(self):
+        if self._length is None:
+            text = self._text
+            length = 0
+            pos = _skip_whitespace(text, self._start + 1)
+            if text[pos:pos + 1] != ']':
+                while True:
+                    pos = _skip_whitespace(text, _skip_value(text, pos))
+                    length += 1
+                    if text[pos:pos + 1] == ']':
+                        break
+                    pos = _expect(text, pos, ',', "Expecting ',' delimiter")
+            self._length = length
+        return self._length
+
+    def __repr__(self):
+        return '<LazyJsonArray at offset {}>'.format(self._start)
+
+
+def loads_lazy(text, lazy_key):
+    """
+    Decodes a JSON document like json.loads(), except that when it is an
+    object, an array under `lazy_key` is returned as a LazyJsonArray.
+    """
+    pos = _skip_whitespace(text, 0)
+    if text[pos:pos + 1] != '{':
+        return json.loads(text)
+
+    event = {}
+    pos = _skip_whitespace(text, pos + 1)
+    if text[pos:pos + 1] == '}':
+        pos += 1
+    else:
+        while True:
+            if text[pos:pos + 1] != '"':
+                raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, pos)
+            key, pos = _DECODER.raw_decode(text, pos)
+            pos = _skip_whitespace(text, pos)
+            pos = _expect(text, pos, ':', "Expecting ':' delimiter")
+            if key == lazy_key and text[pos:pos + 1] == '[':
+                end = _skip_value(text, pos)
+                event[key] = LazyJsonArray(text, pos)
+            else:
+                event[key], end = _DECODER.raw_decode(text, pos)
+            pos = _skip_whitespace(text, end)
+            if text[pos:pos + 1] == '}':
+                pos += 1
+                break
+            pos = _expect(text, pos, ',', "Expecting ',' delimiter")
+
+    if _skip_whitespace(text, pos) != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos)
+    return event
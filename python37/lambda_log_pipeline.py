@@ -0,0 +1,200 @@
+"""
+Buffered output for the handler's logs.
+
+LogPipeline collects what is written to stdout and stderr in memory and
+writes it from a background thread in batches, so print(), context.log()
+and logging calls on the invocation thread do not each cost a write and a
+flush. Batches are written when LOG_FLUSH_BYTES are buffered or the oldest
+buffered text is `flush_interval` seconds old, and writers flush on their
+own thread when `max_bytes` are buffered, so memory stays bounded and no
+output is dropped. flush() writes everything buffered so far before it
+returns; the bootstrap calls it before posting each result.
+"""
+
+import os
+import threading
+import time
+
+
+LOG_FLUSH_BYTES = 64 * 1024
+
+
+class LogPipeline(object):
+    def __init__(self, flush_interval=0.05, max_bytes=1024 * 1024):
+        self.flush_interval = flush_interval
+        self.max_bytes = max(max_bytes, LOG_FLUSH_BYTES)
+        self._init_state()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=self._before_fork,
+                                after_in_parent=self._after_fork_in_parent,
+                                after_in_child=self._after_fork_in_child)
+
+    def _init_state(self):
+        # reentrant, as signal handlers can write while the interrupted
+        # thread is holding them
+        self._lock = threading.RLock()
+        self._condition = threading.Condition(self._lock)
+        self._write_lock = threading.RLock()
+        self._pending = []
+        self._pending_bytes = 0
+        self._pending_since = None
+        self._thread = threading.Thread(target=self._write_loop, name='log-pipeline', daemon=True)
+        self._thread.start()
+
+    def stream(self, stream, line_atomic=False):
+        if line_atomic:
+            return LineAtomicLogStream(self, stream)
+        return BufferedLogStream(self, stream)
+
+    def write(self, stream, text):
+        if not text:
+            return
+        # the plain lock rather than the condition, which is slower to enter
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append((stream, text))
+            self._pending_bytes += len(text)
+            pending_bytes = self._pending_bytes
+            if pending_bytes >= LOG_FLUSH_BYTES:
+                self._condition.notify()
+        if pending_bytes >= self.max_bytes:
+            # the writer thread does not keep up
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        # called with _write_lock held, which keeps batches in order
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+            self._pending_bytes = 0
+            self._pending_since = None
+        if not pending:
+            return
+
+        streams = []
+        index = 0
+        while index < len(pending):
+            stream = pending[index][0]
+            end = index + 1
+            while end < len(pending) and pending[end][0] is stream:
+                end += 1
+            stream.write(''.join(text for _, text in pending[index:end]))
+            if stream not in streams:
+                streams.append(stream)
+            index = end
+        for stream in streams:
+            stream.flush()
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._pending_bytes >= LOG_FLUSH_BYTES:
+                        break
+                    if self._pending_since is None:
+                        self._condition.wait()
+                        continue
+                    remaining = self._pending_since + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            try:
+                self.flush()
+            except Exception:
+                # the output is gone (e.g. a closed pipe), there is nowhere to report it
+                pass
+
+    def _before_fork(self):
+        # nothing buffered is inherited, and written again, by the child
+        self._write_lock.acquire()
+        try:
+            self._write_pending()
+        except Exception:
+            pass
+        self._lock.acquire()
+
+    def _after_fork_in_parent(self):
+        self._lock.release()
+        self._write_lock.release()
+
+    def _after_fork_in_child(self):
+        # the locks may be held by threads that do not exist in the child,
+        # and its writer thread has to be started again
+        self._init_state()
+
+
+def check_str(msg):
+    # rejected on the writing thread, as by a text file, rather than failing
+    # the batch it would be written with
+    if not isinstance(msg, str):
+        raise TypeError('write() argument must be str, not {}'.format(type(msg).__name__))
+
+
+class BufferedLogStream(object):
+    """A text stream that writes through a LogPipeline."""
+
+    def __init__(self, pipeline, stream):
+        self.pipeline = pipeline
+        self.stream = stream
+
+    def __getattr__(self, attr):
+        return getattr(self.stream, attr)
+
+    def write(self, msg):
+        check_str(msg)
+        self.pipeline.write(self.stream, msg)
+        return len(msg)
+
+    def writelines(self, msgs):
+        for msg in msgs:
+            self.write(msg)
+
+    def flush(self):
+        self.pipeline.flush()
+
+
+class LineAtomicLogStream(BufferedLogStream):
+    """
+    A BufferedLogStream for output written by several threads at once.
+
+    print() writes its arguments, separators and the line end separately,
+    so the partial line of each thread is kept until it is complete and
+    lines of different threads never interleave. flush() writes the partial
+    line of the calling thread too.
+    """
+
+    def __init__(self, pipeline, stream):
+        BufferedLogStream.__init__(self, pipeline, stream)
+        self._local = threading.local()
+
+    def write(self, msg):
+        check_str(msg)
+        partial = getattr(self._local, 'partial', None)
+        end = msg.rfind('\n') + 1
+        if end == 0:
+            if partial is None:
+                self._local.partial = [msg]
+            else:
+                partial.append(msg)
+            return len(msg)
+        if partial:
+            partial.append(msg[:end])
+            self.pipeline.write(self.stream, ''.join(partial))
+            partial.clear()
+        else:
+            self.pipeline.write(self.stream, msg[:end])
+        if end < len(msg):
+            self._local.partial = [msg[end:]]
+        return len(msg)
+
+    def flush(self):
+        partial = getattr(self._local, 'partial', None)
+        if partial:
+            self.pipeline.write(self.stream, ''.join(partial))
+            partial.clear()
+        self.pipeline.flush()
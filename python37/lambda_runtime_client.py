@@ -2,15 +2,34 @@
 Copyright (c) 2018 Amazon. All rights reserved.
 """
 
+import asyncio
+import collections
+import collections.abc
 import http.client
 import http
-from collections import defaultdict
+import io
+import queue
+import select
+import socket
+import threading
+import time
+
+
+UNIX_SOCKET_ADDRESS_PREFIX = 'unix:'
+# larger event bodies are read into buffers that are not kept for reuse
+MAX_RETAINED_BUFFER_BYTES = 1024 * 1024
 
 
 class InvocationRequest(object):
     def __init__(self, **kwds):
         self.__dict__.update(kwds)
 
+    def release_event_body(self):
+        """Hands the buffer backing event_body back for reuse, event_body must not be used afterwards."""
+        release = self.__dict__.pop('event_body_release', None)
+        if release is not None:
+            release()
+
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
 
@@ -23,12 +42,373 @@ class LambdaRuntimeClientError(Exception):
         super().__init__(f"Request to Lambda Runtime '{endpoint}' endpoint failed. Reason: '{response_code}'. Response body: '{response_body}'")
 
 
+def make_invocation_request(headers, event_body, event_body_release=None):
+    kwds = dict(
+        invoke_id=headers.get("Lambda-Runtime-Aws-Request-Id"),
+        x_amzn_trace_id=headers.get("Lambda-Runtime-Trace-Id"),
+        invoked_function_arn=headers.get("Lambda-Runtime-Invoked-Function-Arn"),
+        deadline_time_in_ms=int(headers.get("Lambda-Runtime-Deadline-Ms")),
+        client_context=headers.get("Lambda-Runtime-Client-Context"),
+        cloudevents_context=headers.get("Lambda-Runtime-Cloudevents-Context"),
+        cognito_identity=headers.get("Lambda-Runtime-Cognito-Identity"),
+        event_body=event_body
+    )
+    if event_body_release is not None:
+        kwds['event_body_release'] = event_body_release
+    return InvocationRequest(**kwds)
+
+
+class RequestInterrupted(Exception):
+    """Raised by a request that was interrupted, or started after an interruption, by interrupt()."""
+
+
+class ResultStreamError(Exception):
+    """Raised when the iterator of a streamed result fails, the cause is the handler's exception."""
+
+
+def is_result_stream(result):
+    return isinstance(result, (collections.abc.Iterator, collections.abc.AsyncIterator))
+
+
+class StreamingBody(object):
+    """
+    Request body produced by an iterator (or async iterator) of bytes or str
+    chunks, sent with chunked transfer encoding.
+
+    Chunks are coalesced up to `chunk_size` bytes so small writes do not turn
+    into one tiny chunk each, and at most about `chunk_size` bytes plus the
+    current chunk are buffered whatever the size of the whole response. A
+    streaming body can only be sent once, `started` tells whether sending
+    has begun.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, chunks, chunk_size=CHUNK_SIZE):
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.started = False
+
+    @staticmethod
+    def _encode(chunk):
+        if isinstance(chunk, str):
+            return chunk.encode('utf-8')
+        if isinstance(chunk, (bytes, bytearray)):
+            return chunk
+        if isinstance(chunk, memoryview):
+            return chunk.cast('B')
+        raise TypeError(f"Streamed result chunks must be bytes or str, not {type(chunk).__name__}")
+
+    def __iter__(self):
+        self.started = True
+        buffered = []
+        buffered_size = 0
+        try:
+            for chunk in self.chunks:
+                chunk = self._encode(chunk)
+                if not chunk:
+                    continue
+                if not buffered and len(chunk) >= self.chunk_size:
+                    yield chunk
+                    continue
+                buffered.append(chunk)
+                buffered_size += len(chunk)
+                if buffered_size >= self.chunk_size:
+                    yield b''.join(buffered)
+                    buffered, buffered_size = [], 0
+        except Exception as e:
+            raise ResultStreamError(str(e)) from e
+        if buffered:
+            yield b''.join(buffered)
+
+    async def __aiter__(self):
+        if not isinstance(self.chunks, collections.abc.AsyncIterator):
+            for chunk in self:
+                yield chunk
+            return
+
+        self.started = True
+        buffered = []
+        buffered_size = 0
+        try:
+            async for chunk in self.chunks:
+                chunk = self._encode(chunk)
+                if not chunk:
+                    continue
+                if not buffered and len(chunk) >= self.chunk_size:
+                    yield chunk
+                    continue
+                buffered.append(chunk)
+                buffered_size += len(chunk)
+                if buffered_size >= self.chunk_size:
+                    yield b''.join(buffered)
+                    buffered, buffered_size = [], 0
+        except Exception as e:
+            raise ResultStreamError(str(e)) from e
+        if buffered:
+            yield b''.join(buffered)
+
+
+class EventBodyBuffers(object):
+    """
+    Reusable buffers that event bodies are read into.
+
+    Reading with readinto() into a buffer kept from a previous invocation
+    avoids allocating, and for large bodies joining, a new bytes object for
+    every event. At most `max_buffers` released buffers of up to
+    `max_buffer_bytes` are kept, those that fit the typical body size with
+    the least slack first, so that an occasional large event doesn't stay
+    allocated for the life of the process.
+    """
+
+    def __init__(self, max_buffers=2, max_buffer_bytes=MAX_RETAINED_BUFFER_BYTES):
+        self.max_buffers = max_buffers
+        self.max_buffer_bytes = max_buffer_bytes
+        self._free_buffers = []
+        self._recent_sizes = collections.deque(maxlen=16)
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        with self._lock:
+            self._recent_sizes.append(size)
+            fitting = [buffer for buffer in self._free_buffers if len(buffer) >= size]
+            if fitting:
+                buffer = min(fitting, key=len)
+                self._free_buffers.remove(buffer)
+                return buffer
+        return bytearray(size)
+
+    def release(self, buffer):
+        if len(buffer) > self.max_buffer_bytes:
+            return
+        with self._lock:
+            self._free_buffers.append(buffer)
+            if len(self._free_buffers) > self.max_buffers:
+                # the median is not moved by an occasional large body
+                typical_size = sorted(self._recent_sizes)[len(self._recent_sizes) // 2] if self._recent_sizes else 0
+                # buffers too small for a typical body go first, then the largest
+                self._free_buffers.remove(max(self._free_buffers,
+                                              key=lambda buffer: (len(buffer) < typical_size, abs(len(buffer) - typical_size))))
+
+    def read_body(self, response):
+        """
+        Reads a response body into a pooled buffer. Returns the body as a
+        memoryview and a callable that releases it, or the body as bytes and
+        None when the length is not known up front (chunked responses).
+        """
+        if response.length is None:
+            return response.read(), None
+
+        length = response.length
+        buffer = self.acquire(length)
+        body = memoryview(buffer)[:length]
+        filled = 0
+        try:
+            while filled < length:
+                count = response.readinto(body[filled:])
+                if not count:
+                    raise http.client.IncompleteRead(bytes(body[:filled]), length - filled)
+                filled += count
+        except BaseException:
+            body.release()
+            self.release(buffer)
+            raise
+
+        def release():
+            body.release()
+            self.release(buffer)
+
+        return body, release
+
+
+class RuntimeHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        super().connect()
+        # requests and results are small and latency bound
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to the Runtime API listening on a Unix domain socket."""
+
+    def __init__(self, socket_path, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def parse_unix_socket_address(lambda_runtime_address):
+    """Returns the socket path of a `unix:/path/to.sock` address, None for host:port."""
+    if lambda_runtime_address.startswith(UNIX_SOCKET_ADDRESS_PREFIX):
+        return lambda_runtime_address[len(UNIX_SOCKET_ADDRESS_PREFIX):]
+    return None
+
+
+class RuntimeConnectionPool(object):
+    """
+    Small pool of keep-alive connections to the Runtime API.
+
+    Connections are created on demand, so concurrent callers (for example the
+    invocation loop and an InvocationPrefetcher) never share a socket, and at
+    most `pool_size` idle connections are kept around for reuse.
+
+    A request that fails on a reused connection with a reset or closed socket
+    is retried once on a fresh connection, which covers the sidecar closing an
+    idle keep-alive connection. Idempotent requests are additionally retried
+    up to `max_retries` times with exponential backoff. A StreamingBody is
+    only retried if none of it has been consumed yet.
+
+    Requests made with `interruptible` set, i.e. long polls, are aborted by
+    interrupt() and raise RequestInterrupted, as does every later one.
+    """
+    STALE_CONNECTION_ERRORS = (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+    TRANSIENT_ERRORS = (OSError, http.client.HTTPException)
+
+    def __init__(self, lambda_runtime_address, pool_size=2, max_retries=3, backoff=0.05, max_backoff=1.0):
+        self.lambda_runtime_address = lambda_runtime_address
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reconnects = 0
+        self._idle_connections = []
+        self._interruptible_connections = set()
+        self._interrupted = False
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        socket_path = parse_unix_socket_address(self.lambda_runtime_address)
+        if socket_path is not None:
+            return UnixHTTPConnection(socket_path)
+        return RuntimeHTTPConnection(self.lambda_runtime_address)
+
+    def connect(self):
+        connection = self._new_connection()
+        connection.connect()
+        self._release(connection)
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle_connections:
+                return self._idle_connections.pop(), True
+        return self._new_connection(), False
+
+    @staticmethod
+    def is_connection_dropped(connection):
+        """An idle keep-alive connection is readable only once the peer has closed it (or sent garbage)."""
+        if connection.sock is None:
+            return False
+        return bool(select.select([connection.sock], [], [], 0)[0])
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle_connections) < self.pool_size:
+                self._idle_connections.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle_connections, self._idle_connections = self._idle_connections, []
+        for connection in idle_connections:
+            connection.close()
+
+    def interrupt(self):
+        with self._lock:
+            self._interrupted = True
+            connections = list(self._interruptible_connections)
+        for connection in connections:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except (AttributeError, OSError):
+                # not connected yet, or closed already
+                pass
+
+    def _start_interruptible(self, connection):
+        with self._lock:
+            if self._interrupted:
+                raise RequestInterrupted()
+            self._interruptible_connections.add(connection)
+
+    def _finish_interruptible(self, connection):
+        with self._lock:
+            self._interruptible_connections.discard(connection)
+
+    def request(self, method, endpoint, body=None, idempotent=False, read_body=None, interruptible=False):
+        if is_result_stream(body):
+            body = StreamingBody(body)
+        attempt = 0
+        connection, reused = self._acquire()
+        if reused and isinstance(body, StreamingBody) and self.is_connection_dropped(connection):
+            # a stream can't be replayed once started, so don't start it on a closed connection
+            connection.close()
+            connection, reused = self._new_connection(), False
+        while True:
+            try:
+                if interruptible:
+                    self._start_interruptible(connection)
+                try:
+                    if interruptible and connection.sock is None:
+                        # connected before the request, so that interrupt() can shut the socket down
+                        connection.connect()
+                        if self._interrupted:
+                            raise RequestInterrupted()
+                    connection.request(method, endpoint, body)
+                    response = connection.getresponse()
+                    if read_body is not None and response.code == http.HTTPStatus.OK:
+                        response_body = read_body(response)
+                    else:
+                        response_body = response.read()
+                finally:
+                    if interruptible:
+                        self._finish_interruptible(connection)
+            except self.TRANSIENT_ERRORS as e:
+                connection.close()
+                if interruptible and self._interrupted:
+                    raise RequestInterrupted() from e
+                if isinstance(body, StreamingBody) and body.started:
+                    raise
+                stale = reused and attempt == 0 and isinstance(e, self.STALE_CONNECTION_ERRORS)
+                if not stale and not (idempotent and attempt < self.max_retries):
+                    raise
+                if not stale:
+                    time.sleep(min(self.backoff * 2 ** attempt, self.max_backoff))
+                attempt += 1
+                with self._lock:
+                    self.reconnects += 1
+                connection, reused = self._new_connection(), False
+                continue
+            except RequestInterrupted:
+                self._release(connection)
+                raise
+            except BaseException:
+                # e.g. a streamed result failing half way, the request can't be completed
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            return response.code, response.msg, response_body
+
+
 class LambdaRuntimeClient(object):
     LAMBDA_RUNTIME_API_VERSION = '2018-06-01'
 
-    def __init__(self, lambda_runtime_address):
-        self.runtime_connection = http.client.HTTPConnection(lambda_runtime_address)
-        self.runtime_connection.connect()
+    def __init__(self, lambda_runtime_address, pool_size=2, max_retries=3):
+        self.connection_pool = RuntimeConnectionPool(lambda_runtime_address, pool_size, max_retries)
+        self.connection_pool.connect()
+        self.event_body_buffers = EventBodyBuffers(pool_size)
 
         lambda_runtime_base_path = f'/{self.LAMBDA_RUNTIME_API_VERSION}'
         self.init_error_endpoint = f'{lambda_runtime_base_path}/runtime/init/error'
@@ -36,52 +416,273 @@ class LambdaRuntimeClient(object):
         self.response_endpoint = f'{lambda_runtime_base_path}/runtime/invocation/{{}}/response'
         self.error_response_endpoint = f'{lambda_runtime_base_path}/runtime/invocation/{{}}/error'
 
+    @property
+    def reconnects(self):
+        return self.connection_pool.reconnects
+
+    def close(self):
+        self.connection_pool.close()
+
+    def interrupt_wait(self):
+        """Makes a wait_next_invocation() in progress, and every later one, raise RequestInterrupted."""
+        self.connection_pool.interrupt()
+
     def post_init_error(self, error_response_data):
         endpoint = self.init_error_endpoint
-        self.runtime_connection.request("POST", endpoint, error_response_data)
-        response = self.runtime_connection.getresponse()
-        response_body = response.read()
+        response_code, _, response_body = self.connection_pool.request("POST", endpoint, error_response_data)
 
-        if response.code != http.HTTPStatus.ACCEPTED:
-            raise LambdaRuntimeClientError(endpoint, response.code, response_body)
+        if response_code != http.HTTPStatus.ACCEPTED:
+            raise LambdaRuntimeClientError(endpoint, response_code, response_body)
 
     def wait_next_invocation(self):
         endpoint = self.next_invocation_endpoint
-        self.runtime_connection.request("GET", endpoint)
-        response = self.runtime_connection.getresponse()
-        response_body = response.read()
-        headers = defaultdict(lambda: None, {k: v for k, v in response.getheaders()})
-
-        if response.code != http.HTTPStatus.OK:
-            raise LambdaRuntimeClientError(endpoint, response.code, response_body)
-
-        result = InvocationRequest(
-            invoke_id=headers["Lambda-Runtime-Aws-Request-Id"],
-            x_amzn_trace_id=headers["Lambda-Runtime-Trace-Id"],
-            invoked_function_arn=headers["Lambda-Runtime-Invoked-Function-Arn"],
-            deadline_time_in_ms=int(headers["Lambda-Runtime-Deadline-Ms"]),
-            client_context=headers["Lambda-Runtime-Client-Context"],
-            cloudevents_context=headers["Lambda-Runtime-Cloudevents-Context"],
-            cognito_identity=headers["Lambda-Runtime-Cognito-Identity"],
-            event_body=response_body
-        )
-
-        return result
+        response_code, headers, response_body = self.connection_pool.request(
+            "GET", endpoint, idempotent=True, read_body=self.event_body_buffers.read_body, interruptible=True)
+
+        if response_code != http.HTTPStatus.OK:
+            raise LambdaRuntimeClientError(endpoint, response_code, response_body)
+
+        event_body, event_body_release = response_body
+        return make_invocation_request(headers, event_body, event_body_release)
 
     def post_invocation_result(self, invoke_id, result_data):
+        """
+        Posts the result of an invocation. result_data can also be an
+        iterator of bytes or str chunks, which is streamed with chunked
+        transfer encoding. If the iterator raises, the request is aborted
+        and ResultStreamError is raised with the iterator's exception as
+        the cause.
+        """
         endpoint = self.response_endpoint.format(invoke_id)
-        self.runtime_connection.request("POST", endpoint, result_data)
-        response = self.runtime_connection.getresponse()
-        response_body = response.read()
+        response_code, _, response_body = self.connection_pool.request("POST", endpoint, result_data)
 
-        if response.code != http.HTTPStatus.ACCEPTED:
-            raise LambdaRuntimeClientError(endpoint, response.code, response_body)
+        if response_code != http.HTTPStatus.ACCEPTED:
+            raise LambdaRuntimeClientError(endpoint, response_code, response_body)
 
     def post_invocation_error(self, invoke_id, error_response_data):
         endpoint = self.error_response_endpoint.format(invoke_id)
-        self.runtime_connection.request("POST", endpoint, error_response_data)
-        response = self.runtime_connection.getresponse()
-        response_body = response.read()
+        response_code, _, response_body = self.connection_pool.request("POST", endpoint, error_response_data)
+
+        if response_code != http.HTTPStatus.ACCEPTED:
+            raise LambdaRuntimeClientError(endpoint, response_code, response_body)
+
+
+class InvocationPrefetcher(object):
+    """
+    Long-polls the next invocation endpoint from a background thread.
+
+    The prefetcher polls on its own pooled connection and keeps at most
+    `depth` fetched invocations waiting to be taken, so the next event is
+    usually ready by the time the previous result has been posted.
+    """
+
+    def __init__(self, lambda_runtime_client, depth=1):
+        self.lambda_runtime_client = lambda_runtime_client
+        self._invocations = queue.Queue()
+        self._slots = threading.Semaphore(depth)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._prefetch, name='invocation-prefetcher', daemon=True)
+        self._thread.start()
+
+    def _prefetch(self):
+        while True:
+            self._slots.acquire()
+            if self._stopped:
+                return
+            try:
+                invocation = self.lambda_runtime_client.wait_next_invocation()
+            except Exception as e:
+                # surfaced to the invocation loop by the next wait_next_invocation()
+                self._invocations.put(e)
+                return
+            self._invocations.put(invocation)
+
+    def stop(self):
+        """
+        Starts no further polls. The invocations fetched already are still
+        returned by wait_next_invocation(), which returns None instead of
+        blocking once they are taken; a poll in progress is abandoned.
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        # wakes the thread when it is waiting for a slot
+        self._slots.release()
+
+    def wait_next_invocation(self, timeout=None):
+        """Returns the next invocation, or None when none arrives within `timeout` seconds."""
+        if self._stopped:
+            timeout = 0
+        try:
+            invocation = self._invocations.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self._slots.release()
+        if isinstance(invocation, Exception):
+            raise invocation
+        return invocation
+
+
+class AsyncLambdaRuntimeClient(object):
+    """
+    asyncio counterpart of LambdaRuntimeClient.
+
+    Each instance owns a single keep-alive connection, so every invocation
+    that should be in flight at the same time needs its own client.
+    """
+    LAMBDA_RUNTIME_API_VERSION = LambdaRuntimeClient.LAMBDA_RUNTIME_API_VERSION
+
+    def __init__(self, lambda_runtime_address):
+        self.socket_path = parse_unix_socket_address(lambda_runtime_address)
+        if self.socket_path is not None:
+            self.host_header = 'localhost'
+        else:
+            host, _, port = lambda_runtime_address.rpartition(':')
+            self.host = host
+            self.port = int(port)
+            self.host_header = lambda_runtime_address
+        self.reader = None
+        self.writer = None
+
+        lambda_runtime_base_path = f'/{self.LAMBDA_RUNTIME_API_VERSION}'
+        self.init_error_endpoint = f'{lambda_runtime_base_path}/runtime/init/error'
+        self.next_invocation_endpoint = f'{lambda_runtime_base_path}/runtime/invocation/next'
+        self.response_endpoint = f'{lambda_runtime_base_path}/runtime/invocation/{{}}/response'
+        self.error_response_endpoint = f'{lambda_runtime_base_path}/runtime/invocation/{{}}/error'
+
+    async def connect(self):
+        if self.socket_path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader, self.writer = None, None
+
+    async def _request(self, method, endpoint, body=None):
+        if is_result_stream(body):
+            body = StreamingBody(body)
+            if self.reader is not None:
+                # a stream can't be replayed once started, so don't start it on a closed
+                # connection; yielding once lets the loop notice an already received EOF
+                await asyncio.sleep(0)
+                if self.reader.at_eof():
+                    self.close()
+        reused = self.writer is not None
+        try:
+            return await self._request_once(method, endpoint, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            if not reused or (isinstance(body, StreamingBody) and body.started):
+                raise
+        except BaseException:
+            self.close()
+            raise
+        # the sidecar closed the idle keep-alive connection, retry once on a fresh one
+        return await self._request_once(method, endpoint, body)
+
+    async def _request_once(self, method, endpoint, body=None):
+        if self.writer is None:
+            await self.connect()
+
+        if isinstance(body, StreamingBody):
+            request_head = (
+                f'{method} {endpoint} HTTP/1.1\r\n'
+                f'Host: {self.host_header}\r\n'
+                'Transfer-Encoding: chunked\r\n'
+                '\r\n'
+            )
+            self.writer.write(request_head.encode('latin-1'))
+            async for chunk in body:
+                self.writer.write(b'%X\r\n' % len(chunk) + chunk + b'\r\n')
+                await self.writer.drain()
+            self.writer.write(b'0\r\n\r\n')
+            await self.writer.drain()
+        else:
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            body = body or b''
+            request_head = (
+                f'{method} {endpoint} HTTP/1.1\r\n'
+                f'Host: {self.host_header}\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                '\r\n'
+            )
+            self.writer.write(request_head.encode('latin-1') + body)
+            await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            self.close()
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+        try:
+            response_code = int(status_line.split(None, 2)[1])
+        except (IndexError, ValueError):
+            self.close()
+            raise http.client.BadStatusLine(status_line.decode('latin-1'))
+
+        header_lines = []
+        while True:
+            line = await self.reader.readline()
+            header_lines.append(line)
+            if line in (b'\r\n', b'\n', b''):
+                break
+        headers = http.client.parse_headers(io.BytesIO(b''.join(header_lines)))
+
+        if headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            response_body = await self._read_chunked()
+        elif headers.get('Content-Length') is not None:
+            response_body = await self.reader.readexactly(int(headers['Content-Length']))
+        else:
+            response_body = await self.reader.read()
+            self.close()
+
+        if headers.get('Connection', '').lower() == 'close':
+            self.close()
+
+        return response_code, headers, response_body
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size_line = await self.reader.readline()
+            chunk_size = int(size_line.split(b';', 1)[0], 16)
+            if chunk_size == 0:
+                # skip trailers up to the terminating empty line
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(chunk_size))
+            await self.reader.readexactly(2)
+
+    async def post_init_error(self, error_response_data):
+        endpoint = self.init_error_endpoint
+        response_code, _, response_body = await self._request("POST", endpoint, error_response_data)
+
+        if response_code != http.HTTPStatus.ACCEPTED:
+            raise LambdaRuntimeClientError(endpoint, response_code, response_body)
+
+    async def wait_next_invocation(self):
+        endpoint = self.next_invocation_endpoint
+        response_code, headers, response_body = await self._request("GET", endpoint)
+
+        if response_code != http.HTTPStatus.OK:
+            raise LambdaRuntimeClientError(endpoint, response_code, response_body)
+
+        return make_invocation_request(headers, response_body)
+
+    async def post_invocation_result(self, invoke_id, result_data):
+        endpoint = self.response_endpoint.format(invoke_id)
+        response_code, _, response_body = await self._request("POST", endpoint, result_data)
+
+        if response_code != http.HTTPStatus.ACCEPTED:
+            raise LambdaRuntimeClientError(endpoint, response_code, response_body)
+
+    async def post_invocation_error(self, invoke_id, error_response_data):
+        endpoint = self.error_response_endpoint.format(invoke_id)
+        response_code, _, response_body = await self._request("POST", endpoint, error_response_data)
 
-        if response.code != http.HTTPStatus.ACCEPTED:
-            raise LambdaRuntimeClientError(endpoint, response.code, response_body)
+        if response_code != http.HTTPStatus.ACCEPTED:
+            raise LambdaRuntimeClientError(endpoint, response_code, response_body)
@@ -0,0 +1,184 @@
+"""
+Per-invocation runtime metrics in the Prometheus text exposition format.
+
+RuntimeMetrics keeps a latency histogram for each stage of an invocation,
+histograms of event and result sizes and a counter of errors by
+errorType. They can be served over HTTP with serve_metrics() or written
+to a file periodically with write_metrics_periodically().
+"""
+
+import bisect
+import http.server
+import os
+import threading
+import time
+
+
+STAGES = ('wait_next', 'decode', 'context', 'handler', 'encode', 'post')
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 6291456)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return ','.join('{}="{}"'.format(name, _escape_label_value(value)) for name, value in labels)
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        # buckets are upper bounds, inclusive
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=()):
+        prefix = _format_labels(labels)
+        bucket_prefix = prefix + ',' if prefix else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append('{}_bucket{{{}le="{}"}} {}'.format(name, bucket_prefix, bound, cumulative))
+        lines.append('{}_bucket{{{}le="+Inf"}} {}'.format(name, bucket_prefix, self.count))
+        labels_text = '{' + prefix + '}' if prefix else ''
+        lines.append('{}_sum{} {}'.format(name, labels_text, self.sum))
+        lines.append('{}_count{} {}'.format(name, labels_text, self.count))
+        return lines
+
+
+class StageTimer(object):
+    """
+    Measures the stages of one invocation. lap() attributes the time since
+    the previous lap to a stage, a stage can be lapped more than once, and
+    finish() records the totals.
+    """
+    __slots__ = ('metrics', 'durations', 'last')
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.durations = {}
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.durations[stage] = self.durations.get(stage, 0) + now - self.last
+        self.last = now
+
+    def finish(self):
+        self.metrics.observe_stages(self.durations)
+        self.durations = {}
+
+
+class NullStageTimer(object):
+    """StageTimer stand-in used when metrics are disabled."""
+
+    def lap(self, stage):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_STAGE_TIMER = NullStageTimer()
+
+
+class RuntimeMetrics(object):
+    def __init__(self):
+        self.stage_seconds = {stage: Histogram(LATENCY_BUCKETS) for stage in STAGES}
+        self.payload_bytes = {'event': Histogram(SIZE_BUCKETS), 'result': Histogram(SIZE_BUCKETS)}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def stage_timer(self):
+        return StageTimer(self)
+
+    def observe_stages(self, durations):
+        with self._lock:
+            for stage, seconds in durations.items():
+                self.stage_seconds[stage].observe(seconds)
+
+    def observe_payload(self, kind, size):
+        with self._lock:
+            self.payload_bytes[kind].observe(size)
+
+    def count_error(self, error_type):
+        with self._lock:
+            self.errors[error_type] = self.errors.get(error_type, 0) + 1
+
+    def render(self):
+        with self._lock:
+            lines = [
+                '# HELP klr_stage_duration_seconds Time spent in each stage of an invocation.',
+                '# TYPE klr_stage_duration_seconds histogram',
+            ]
+            for stage in STAGES:
+                lines.extend(self.stage_seconds[stage].render('klr_stage_duration_seconds', (('stage', stage),)))
+            lines.extend([
+                '# HELP klr_payload_size_bytes Size of invocation events and results.',
+                '# TYPE klr_payload_size_bytes histogram',
+            ])
+            for kind, histogram in sorted(self.payload_bytes.items()):
+                lines.extend(histogram.render('klr_payload_size_bytes', (('kind', kind),)))
+            lines.extend([
+                '# HELP klr_invocation_errors_total Invocation errors by errorType.',
+                '# TYPE klr_invocation_errors_total counter',
+            ])
+            for error_type, count in sorted(self.errors.items()):
+                lines.append('klr_invocation_errors_total{{{}}} {}'.format(_format_labels((('error_type', error_type),)), count))
+        return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(metrics, address):
+    """Serves GET /metrics on `address` ("host:port") from a daemon thread and returns the server."""
+    class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    host, _, port = address.rpartition(':')
+    server = http.server.HTTPServer((host, int(port)), MetricsRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    return server
+
+
+def write_metrics(metrics, path):
+    # written to a temporary file and renamed, so scrapers never read a partial file
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'w') as metrics_file:
+        metrics_file.write(metrics.render())
+    os.replace(temporary_path, path)
+
+
+def write_metrics_periodically(metrics, path, interval):
+    """Rewrites the metrics file every `interval` seconds from a daemon thread."""
+    def write_loop():
+        while True:
+            try:
+                write_metrics(metrics, path)
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    thread = threading.Thread(target=write_loop, name='metrics-writer', daemon=True)
+    thread.start()
+    return thread
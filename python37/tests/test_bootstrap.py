@@ -0,0 +1,630 @@
+"""
+Smoke tests of the bootstrap against a fake Runtime API.
+
+Every test starts the bootstrap in a subprocess with a handler module
+written to a temporary task root, queues invocations on the fake API and
+checks what was posted back.
+
+    python3 -m pytest python37/tests
+"""
+
+import http.server
+import json
+import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import unittest
+import uuid
+
+
+RUNTIME_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RUNTIME_DIR)
+
+import bootstrap  # noqa: E402
+from lambda_runtime_client import LambdaRuntimeClient, RequestInterrupted  # noqa: E402
+
+
+HANDLERS = textwrap.dedent('''
+    import concurrent.futures
+    import logging
+    import time
+
+
+    def echo(event, context):
+        return {'echo': event}
+
+
+    def slow_echo(event, context):
+        time.sleep(0.2)
+        return {'echo': event}
+
+
+    def sleeps(event, context):
+        time.sleep(event['sleep'])
+        return event
+
+
+    def sleepy_batch(batch):
+        time.sleep(max(event['sleep'] for event, context in batch))
+        return [event for event, context in batch]
+
+
+    def slow_batch(batch):
+        time.sleep(0.2)
+        return [{'echo': event} for event, context in batch]
+
+
+    def raises(event, context):
+        raise ValueError('boom')
+
+
+    def prints_and_sleeps(event, context):
+        print('printed before SIGTERM')
+        open(event['marker'], 'w').close()
+        time.sleep(10)
+        return event
+
+
+    def logs_from_thread(event, context):
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            executor.submit(logging.getLogger('worker').warning, 'from a thread').result()
+        return event
+''')
+
+
+class FakeRuntimeApi(object):
+    def __init__(self):
+        self.events = queue.Queue()
+        self.results = {}
+        self.errors = {}
+        self.init_errors = []
+        self.condition = threading.Condition()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._make_request_handler())
+        self.server.daemon_threads = True
+        self.address = '127.0.0.1:{}'.format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _make_request_handler(self):
+        api = self
+
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_body(self):
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    body = b''
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            return body
+                        body += self.rfile.read(size)
+                        self.rfile.readline()
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def _respond(self, code, body=b'', headers=None):
+                self.send_response(code)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if not self.path.endswith('/runtime/invocation/next'):
+                    self._respond(404)
+                    return
+                body, headers = api.events.get()
+                self._respond(200, body, headers)
+
+            def do_POST(self):
+                body = self._read_body()
+                parts = self.path.split('/')
+                with api.condition:
+                    if self.path.endswith('/init/error'):
+                        api.init_errors.append(body)
+                    elif parts[-1] == 'response':
+                        api.results[parts[-2]] = body
+                    elif parts[-1] == 'error':
+                        api.errors[parts[-2]] = body
+                    api.condition.notify_all()
+                self._respond(202)
+
+        return RequestHandler
+
+    def invoke(self, event, deadline_ms=30000):
+        invoke_id = str(uuid.uuid4())
+        self.events.put((json.dumps(event).encode('utf-8'), {
+            'Lambda-Runtime-Aws-Request-Id': invoke_id,
+            'Lambda-Runtime-Deadline-Ms': str(int(time.time() * 1000) + deadline_ms),
+            'Lambda-Runtime-Invoked-Function-Arn': 'arn:aws:lambda:us-east-1:123456789012:function:test',
+        }))
+        return invoke_id
+
+    def wait_for(self, invoke_ids, timeout=10):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while not all(invoke_id in self.results or invoke_id in self.errors for invoke_id in invoke_ids):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise AssertionError('invocations not posted: {}'.format(
+                        [invoke_id for invoke_id in invoke_ids if invoke_id not in self.results and invoke_id not in self.errors]))
+                self.condition.wait(remaining)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BootstrapTestCase(unittest.TestCase):
+    handlers = HANDLERS
+
+    def setUp(self):
+        self.api = FakeRuntimeApi()
+        self.addCleanup(self.api.close)
+        task_root = tempfile.TemporaryDirectory()
+        self.addCleanup(task_root.cleanup)
+        self.task_root = task_root.name
+        self.write_module('handlers', self.handlers)
+
+    def write_module(self, name, source):
+        with open(os.path.join(self.task_root, name + '.py'), 'w') as module_file:
+            module_file.write(textwrap.dedent(source))
+
+    def start_bootstrap(self, handler, env=None):
+        bootstrap_env = dict(os.environ)
+        bootstrap_env.pop('PYTHONPATH', None)
+        bootstrap_env.update({
+            'AWS_LAMBDA_RUNTIME_API': self.api.address,
+            'LAMBDA_TASK_ROOT': self.task_root,
+            '_HANDLER': handler,
+        })
+        bootstrap_env.update(env or {})
+        process = subprocess.Popen([sys.executable, os.path.join(RUNTIME_DIR, 'bootstrap')],
+                                   env=bootstrap_env, cwd=self.task_root,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.addCleanup(self.stop_bootstrap, process)
+        return process
+
+    @staticmethod
+    def stop_bootstrap(process):
+        """Kills the bootstrap unless it exited and returns its stdout and stderr."""
+        if process.stdout.closed:
+            return '', ''
+        if process.poll() is None:
+            process.kill()
+        stdout, stderr = process.communicate()
+        return stdout.decode('utf-8'), stderr.decode('utf-8')
+
+
+class InvocationTest(BootstrapTestCase):
+    def test_result_is_posted(self):
+        self.start_bootstrap('handlers.echo')
+        invoke_id = self.api.invoke({'a': 1})
+        self.api.wait_for([invoke_id])
+        self.assertEqual(json.loads(self.api.results[invoke_id]), {'echo': {'a': 1}})
+
+    def test_handler_exception_is_posted_as_error(self):
+        self.start_bootstrap('handlers.raises')
+        invoke_ids = [self.api.invoke({'a': 1}), self.api.invoke({'a': 2})]
+        self.api.wait_for(invoke_ids)
+        for invoke_id in invoke_ids:
+            error = json.loads(self.api.errors[invoke_id])
+            self.assertEqual(error['errorType'], 'ValueError')
+            self.assertEqual(error['errorMessage'], 'boom')
+
+
+class HandlerLoadingTest(BootstrapTestCase):
+    def invoke_error(self, handler):
+        self.start_bootstrap(handler)
+        invoke_id = self.api.invoke({})
+        self.api.wait_for([invoke_id])
+        self.assertNotIn(invoke_id, self.api.results)
+        return json.loads(self.api.errors[invoke_id])
+
+    def test_missing_module(self):
+        error = self.invoke_error('missing.handler')
+        self.assertIn("Unable to import module 'missing'", error['errorMessage'])
+
+    def test_missing_handler(self):
+        error = self.invoke_error('handlers.missing')
+        self.assertIn("Handler 'missing' missing on module 'handlers'", error['errorMessage'])
+
+    def test_syntax_error(self):
+        self.write_module('broken', 'def handler(event, context)\n    return event\n')
+        error = self.invoke_error('broken.handler')
+        self.assertIn("Syntax error in module 'broken'", error['errorMessage'])
+
+    def test_builtin_module(self):
+        error = self.invoke_error('sys.handler')
+        self.assertIn('Cannot use built-in module sys as a handler module', error['errorMessage'])
+
+    def test_module_named_like_a_module_of_the_runtime(self):
+        for modname in ('queue', 'signal', 'uuid'):
+            with self.subTest(modname=modname):
+                # the poll of the previous bootstrap would take the invocation
+                self.api = FakeRuntimeApi()
+                self.addCleanup(self.api.close)
+                self.write_module(modname, '''
+                    import queue
+
+
+                    def handler(event, context):
+                        return [__name__, queue.Queue.__module__]
+                ''')
+                process = self.start_bootstrap(modname + '.handler')
+                invoke_id = self.api.invoke({})
+                self.api.wait_for([invoke_id])
+                self.assertEqual(json.loads(self.api.results[invoke_id]), [modname, 'queue'])
+                self.stop_bootstrap(process)
+                os.remove(os.path.join(self.task_root, modname + '.py'))
+
+    def test_package_named_like_a_module_of_the_runtime(self):
+        os.mkdir(os.path.join(self.task_root, 'signal'))
+        self.write_module(os.path.join('signal', '__init__'), '')
+        self.write_module(os.path.join('signal', 'app'), 'def handler(event, context):\n    return event\n')
+        error = self.invoke_error('signal.app.handler')
+        self.assertIn('Cannot use package signal for the handler module', error['errorMessage'])
+
+
+class RequestContextTest(BootstrapTestCase):
+    def test_request_id_is_logged_from_handler_threads(self):
+        process = self.start_bootstrap('handlers.logs_from_thread')
+        invoke_id = self.api.invoke({})
+        self.api.wait_for([invoke_id])
+        stdout, _ = self.stop_bootstrap(process)
+        self.assertIn('\t{}\tfrom a thread'.format(invoke_id), stdout)
+
+    def test_request_id_is_logged_from_handler_threads_as_json(self):
+        process = self.start_bootstrap('handlers.logs_from_thread', {'KLR_LOG_FORMAT': 'json'})
+        invoke_id = self.api.invoke({})
+        self.api.wait_for([invoke_id])
+        stdout, _ = self.stop_bootstrap(process)
+        records = [json.loads(line) for line in stdout.splitlines() if line.startswith('{')]
+        self.assertEqual([record['aws_request_id'] for record in records if record['message'] == 'from a thread'], [invoke_id])
+
+
+class InterruptWaitTest(unittest.TestCase):
+    def test_poll_is_interrupted(self):
+        api = FakeRuntimeApi()
+        self.addCleanup(api.close)
+        lambda_runtime_client = LambdaRuntimeClient(api.address)
+        errors = []
+
+        def poll():
+            try:
+                lambda_runtime_client.wait_next_invocation()
+            except RequestInterrupted as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=poll, daemon=True)
+        thread.start()
+        time.sleep(0.2)
+        lambda_runtime_client.interrupt_wait()
+        thread.join(5)
+        self.assertEqual(len(errors), 1)
+        api.invoke({})
+        with self.assertRaises(RequestInterrupted):
+            lambda_runtime_client.wait_next_invocation()
+        # results are still posted
+        lambda_runtime_client.post_invocation_result('id', b'{}')
+        self.assertEqual(api.results['id'], b'{}')
+
+
+class InvocationThreadPoolTest(BootstrapTestCase):
+    def test_failed_connect_is_raised_by_run(self):
+        with socket.socket() as unused:
+            unused.bind(('127.0.0.1', 0))
+            address = '127.0.0.1:{}'.format(unused.getsockname()[1])
+        thread_pool = bootstrap.InvocationThreadPool(address, lambda event, context: event, 2)
+        with self.assertRaises(ConnectionRefusedError):
+            thread_pool.run()
+
+    def test_taken_invocations_are_handled_on_a_memory_recycle(self):
+        invoke_ids = [self.api.invoke({'a': index}) for index in range(3)]
+        process = self.start_bootstrap('handlers.slow_echo', dict(MemoryRecycleTest.recycle_env, KLR_THREADS='3'))
+        self.assertEqual(process.wait(10), 0)
+        # every thread took an invocation before the first one finished
+        self.assertEqual(sorted(self.api.results), sorted(invoke_ids))
+
+    def test_idle_threads_stop_polling_on_a_memory_recycle(self):
+        invoke_id = self.api.invoke({})
+        process = self.start_bootstrap('handlers.slow_echo', dict(MemoryRecycleTest.recycle_env, KLR_THREADS='4'))
+        self.assertEqual(process.wait(10), 0)
+        self.assertEqual(list(self.api.results), [invoke_id])
+
+
+class DeadlineTest(BootstrapTestCase):
+    def test_handler_is_interrupted_at_the_deadline(self):
+        self.start_bootstrap('handlers.sleeps')
+        invoke_id = self.api.invoke({'sleep': 5}, deadline_ms=300)
+        self.api.wait_for([invoke_id], timeout=3)
+        self.assertEqual(json.loads(self.api.errors[invoke_id])['errorType'], 'InvocationTimeout')
+
+    def test_sigalrm_handler_of_the_function_is_left_alone(self):
+        self.write_module('alarms', '''
+            import signal
+            import time
+
+
+            class Alarm(Exception):
+                pass
+
+
+            def on_alarm(signum, frame):
+                raise Alarm()
+
+
+            signal.signal(signal.SIGALRM, on_alarm)
+
+
+            def handler(event, context):
+                signal.setitimer(signal.ITIMER_REAL, 0.05)
+                try:
+                    time.sleep(1)
+                except Alarm:
+                    return 'alarm'
+                return 'no alarm'
+        ''')
+        self.start_bootstrap('alarms.handler')
+        invoke_ids = [self.api.invoke({}), self.api.invoke({})]
+        self.api.wait_for(invoke_ids)
+        for invoke_id in invoke_ids:
+            self.assertEqual(json.loads(self.api.results[invoke_id]), 'alarm')
+
+
+    def test_batch_timeout_is_posted_to_expired_invocations_only(self):
+        # both are queued before the bootstrap starts, so they form one batch
+        expiring_id = self.api.invoke({'sleep': 0.5}, deadline_ms=300)
+        invoke_id = self.api.invoke({'sleep': 0}, deadline_ms=30000)
+        self.start_bootstrap('handlers.sleepy_batch', {'KLR_BATCH_SIZE': '2', 'KLR_BATCH_LINGER_MS': '200'})
+        self.api.wait_for([expiring_id, invoke_id])
+        self.assertEqual(json.loads(self.api.errors[expiring_id])['errorType'], 'InvocationTimeout')
+        self.assertEqual(json.loads(self.api.results[invoke_id]), {'sleep': 0})
+
+
+class JsonCodecTest(unittest.TestCase):
+    def test_non_finite_floats_are_found(self):
+        self.assertTrue(bootstrap.has_non_finite_float({'a': [1, (2, float('nan'))]}))
+        self.assertTrue(bootstrap.has_non_finite_float([float('-inf')]))
+        self.assertFalse(bootstrap.has_non_finite_float({'a': [1.5, None, 'inf']}))
+
+    def test_orjson_writes_non_finite_floats_like_the_stdlib_codec(self):
+        try:
+            codec = bootstrap.make_json_codec('orjson')
+        except (ImportError, AttributeError):
+            self.skipTest('needs orjson 3.9+')
+        result = {'a': [float('nan'), float('inf'), float('-inf'), None]}
+        self.assertEqual(codec.dumpb(result), bootstrap.StdlibJsonCodec().dumpb(result))
+
+
+class WarmupTest(BootstrapTestCase):
+    def setUp(self):
+        super().setUp()
+        # every handler returns the events it was called with so far, the warm-up event included
+        self.write_module('recording', '''
+            seen = []
+
+
+            def record(event):
+                seen.append(bytes(event).decode('utf-8') if isinstance(event, (bytes, memoryview)) else event)
+                return seen
+
+
+            def json_events(event, context):
+                return record(event)
+
+
+            def binary_events(event, context):
+                return record(event)
+
+
+            def binary_batch(batch):
+                record(batch[0][0])
+                return [seen for event, context in batch]
+
+
+            binary_events.klr_handler_mode = 'binary'
+            binary_batch.klr_handler_mode = 'binary'
+        ''')
+
+    def invoke_result(self, handler, env=None):
+        self.start_bootstrap(handler, dict({'KLR_WARMUP_EVENT': '{"warmup": true}'}, **(env or {})))
+        invoke_id = self.api.invoke({'a': 1})
+        self.api.wait_for([invoke_id])
+        return json.loads(self.api.results[invoke_id])
+
+    def test_json_handler_receives_decoded_event(self):
+        self.assertEqual(self.invoke_result('recording.json_events'), [{'warmup': True}, {'a': 1}])
+
+    def test_binary_handler_receives_event_body(self):
+        self.assertEqual(self.invoke_result('recording.binary_events'), ['{"warmup": true}', '{"a": 1}'])
+
+    def test_binary_batch_handler_receives_event_body(self):
+        result = self.invoke_result('recording.binary_batch', {'KLR_BATCH_SIZE': '2'})
+        self.assertEqual(result, ['{"warmup": true}', '{"a": 1}'])
+
+
+class MemoryRecycleTest(BootstrapTestCase):
+    # every invocation crosses a threshold of 1% of 1 MB
+    recycle_env = {'AWS_LAMBDA_FUNCTION_MEMORY_SIZE': '1', 'KLR_MEMORY_RECYCLE_THRESHOLD': '0.01'}
+
+    def assert_prefetched_invocations_are_handled(self, handler, env):
+        invoke_ids = [self.api.invoke({'a': index}) for index in range(4)]
+        process = self.start_bootstrap(handler, dict(self.recycle_env, **env))
+        self.assertEqual(process.wait(10), 0)
+        # the first invocation is handled, then whatever was prefetched during it
+        handled = [invoke_id for invoke_id in invoke_ids if invoke_id in self.api.results]
+        self.assertEqual(handled, invoke_ids[:len(handled)])
+        self.assertGreater(len(handled), 1)
+        # only a poll in progress when the prefetcher stopped may be abandoned
+        self.assertGreaterEqual(len(handled) + 1 + self.api.events.qsize(), len(invoke_ids))
+
+    def test_prefetched_invocation_is_handled_before_exit(self):
+        self.assert_prefetched_invocations_are_handled('handlers.slow_echo', {'KLR_PREFETCH': '1'})
+
+    def test_prefetched_batch_is_handled_before_exit(self):
+        self.assert_prefetched_invocations_are_handled('handlers.slow_batch', {'KLR_BATCH_SIZE': '4'})
+
+
+class PathManifestTest(BootstrapTestCase):
+    def write_manifest(self):
+        self.manifest_path = os.path.join(self.task_root, 'manifest.json')
+        env = dict(os.environ, LAMBDA_TASK_ROOT=self.task_root)
+        env.pop('PYTHONPATH', None)
+        subprocess.run([sys.executable, os.path.join(RUNTIME_DIR, 'bootstrap.py'), 'path-manifest', '--output', self.manifest_path],
+                       env=env, cwd=self.task_root, check=True)
+
+    def test_pth_imports_get_their_site_directory(self):
+        # the way setuptools' *-nspkg.pth files find their site directory
+        with open(os.path.join(self.task_root, 'marker-nspkg.pth'), 'w') as pth:
+            pth.write("import sys, types; sys.modules.setdefault('pth_marker', types.ModuleType('pth_marker'))"
+                      ".sitedir = sys._getframe(1).f_locals['sitedir']\n")
+        self.write_module('reads_marker', '''
+            import pth_marker
+
+
+            def handler(event, context):
+                return pth_marker.sitedir
+        ''')
+        self.write_manifest()
+        process = self.start_bootstrap('reads_marker.handler', {'KLR_PATH_MANIFEST': self.manifest_path})
+        invoke_id = self.api.invoke({})
+        self.api.wait_for([invoke_id])
+        self.assertEqual(json.loads(self.api.results[invoke_id]), self.task_root)
+        _, stderr = self.stop_bootstrap(process)
+        self.assertNotIn('path_manifest_stale', stderr)
+
+    def test_failing_pth_import_is_reported_like_site(self):
+        with open(os.path.join(self.task_root, 'broken.pth'), 'w') as pth:
+            pth.write("import missing_module_of_a_pth_file\nimport sys; sys.stderr.write('not reached')\n")
+        self.write_manifest()
+        process = self.start_bootstrap('handlers.echo', {'KLR_PATH_MANIFEST': self.manifest_path})
+        invoke_id = self.api.invoke({'a': 1})
+        self.api.wait_for([invoke_id])
+        self.assertIn(invoke_id, self.api.results)
+        _, stderr = self.stop_bootstrap(process)
+        self.assertNotIn('path_manifest_stale', stderr)
+        self.assertIn('Error processing line 1 of {}'.format(os.path.join(self.task_root, 'broken.pth')), stderr)
+        self.assertIn('Remainder of file ignored', stderr)
+        self.assertNotIn('not reached', stderr)
+
+
+class SigtermTest(BootstrapTestCase):
+    def assert_output_is_flushed(self, env):
+        marker = os.path.join(self.task_root, 'marker')
+        # nothing is written by the interval while the handler sleeps
+        process = self.start_bootstrap('handlers.prints_and_sleeps', dict({'KLR_LOG_FLUSH_INTERVAL_MS': '60000'}, **env))
+        self.api.invoke({'marker': marker})
+        for _ in range(100):
+            if os.path.exists(marker):
+                break
+            time.sleep(0.1)
+        process.send_signal(signal.SIGTERM)
+        self.assertEqual(process.wait(10), 128 + signal.SIGTERM)
+        stdout, _ = self.stop_bootstrap(process)
+        self.assertIn('printed before SIGTERM', stdout)
+
+    def test_buffered_output_is_flushed(self):
+        self.assert_output_is_flushed({})
+
+    def test_buffered_output_of_prefork_workers_is_flushed(self):
+        self.assert_output_is_flushed({'KLR_PREFORK_WORKERS': '1'})
+
+
+def child_pids(pid):
+    with open('/proc/{0}/task/{0}/children'.format(pid)) as children:
+        return [int(child) for child in children.read().split()]
+
+
+def is_running(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat:
+            # zombies of an exited worker are not running
+            return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def kill_all(pids):
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/task'), 'needs /proc')
+class PreforkTest(BootstrapTestCase):
+    def test_workers_exit_when_the_supervisor_is_killed(self):
+        process = self.start_bootstrap('handlers.echo', {'KLR_PREFORK_WORKERS': '2'})
+        invoke_id = self.api.invoke({'a': 1})
+        self.api.wait_for([invoke_id])
+        self.assertEqual(json.loads(self.api.results[invoke_id]), {'echo': {'a': 1}})
+        workers = child_pids(process.pid)
+        self.assertEqual(len(workers), 2)
+        self.addCleanup(kill_all, workers)
+
+        process.kill()
+        process.wait()
+        deadline = time.monotonic() + 5
+        while any(is_running(worker) for worker in workers) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual([worker for worker in workers if is_running(worker)], [])
+
+
+class InitTest(BootstrapTestCase):
+    def wait_for_init_error(self, process):
+        self.assertEqual(process.wait(10), 1)
+        self.assertEqual(len(self.api.init_errors), 1)
+        return json.loads(self.api.init_errors[0])
+
+    def test_invalid_log_flush_interval_is_posted_as_init_error(self):
+        process = self.start_bootstrap('handlers.echo', {'KLR_LOG_FLUSH_INTERVAL_MS': 'soon'})
+        error = self.wait_for_init_error(process)
+        self.assertEqual(error['errorType'], 'ValueError')
+
+    def test_invalid_tracemalloc_interval_is_posted_as_init_error(self):
+        process = self.start_bootstrap('handlers.echo', {'KLR_TRACEMALLOC_TOP': '5', 'KLR_TRACEMALLOC_INTERVAL': '0'})
+        error = self.wait_for_init_error(process)
+        self.assertIn('KLR_TRACEMALLOC_INTERVAL', error['errorMessage'])
+
+    def test_invalid_deadline_grace_is_posted_as_init_error(self):
+        process = self.start_bootstrap('handlers.echo', {'KLR_DEADLINE_GRACE_MS': '-1'})
+        error = self.wait_for_init_error(process)
+        self.assertIn('KLR_DEADLINE_GRACE_MS', error['errorMessage'])
+
+    def test_invalid_batch_linger_is_posted_as_init_error(self):
+        process = self.start_bootstrap('handlers.slow_batch', {'KLR_BATCH_SIZE': '4', 'KLR_BATCH_LINGER_MS': 'x'})
+        error = self.wait_for_init_error(process)
+        self.assertEqual(error['errorType'], 'ValueError')
+
+    def test_invalid_batch_max_bytes_is_posted_as_init_error(self):
+        process = self.start_bootstrap('handlers.slow_batch', {'KLR_BATCH_SIZE': '4', 'KLR_BATCH_MAX_BYTES': '0'})
+        error = self.wait_for_init_error(process)
+        self.assertIn('KLR_BATCH_MAX_BYTES', error['errorMessage'])
+
+    def test_invalid_metrics_file_interval_is_posted_as_init_error(self):
+        metrics_path = os.path.join(self.task_root, 'metrics.prom')
+        process = self.start_bootstrap('handlers.echo', {'KLR_METRICS_FILE': metrics_path, 'KLR_METRICS_FILE_INTERVAL': '0'})
+        error = self.wait_for_init_error(process)
+        self.assertIn('KLR_METRICS_FILE_INTERVAL', error['errorMessage'])
+
+    def test_metrics_addr_with_several_processes_is_posted_as_init_error(self):
+        process = self.start_bootstrap('handlers.echo', {'KLR_METRICS_ADDR': '127.0.0.1:0', 'INVOKER_COUNT': '2'})
+        error = self.wait_for_init_error(process)
+        self.assertIn('KLR_METRICS_ADDR', error['errorMessage'])
+
+
+if __name__ == '__main__':
+    unittest.main()
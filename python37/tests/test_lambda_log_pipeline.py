@@ -0,0 +1,39 @@
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lambda_log_pipeline import LogPipeline  # noqa: E402
+
+
+class LogStreamTest(unittest.TestCase):
+    def test_output_is_written_in_order(self):
+        output = io.StringIO()
+        for line_atomic in (False, True):
+            with self.subTest(line_atomic=line_atomic):
+                output.seek(0)
+                output.truncate()
+                stream = LogPipeline().stream(output, line_atomic)
+                stream.write('a')
+                stream.writelines(['b\n', 'c'])
+                stream.flush()
+                self.assertEqual(output.getvalue(), 'ab\nc')
+
+    def test_non_str_is_rejected_by_write(self):
+        output = io.StringIO()
+        for line_atomic in (False, True):
+            with self.subTest(line_atomic=line_atomic):
+                stream = LogPipeline().stream(output, line_atomic)
+                with self.assertRaises(TypeError):
+                    stream.write(b'bytes\n')
+                with self.assertRaises(TypeError):
+                    stream.writelines(['text\n', 1])
+                stream.write('after\n')
+                stream.flush()
+                self.assertTrue(output.getvalue().endswith('after\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lambda_runtime_client import EventBodyBuffers  # noqa: E402
+
+
+class EventBodyBuffersTest(unittest.TestCase):
+    def test_released_buffer_is_reused(self):
+        buffers = EventBodyBuffers()
+        buffer = buffers.acquire(100)
+        buffers.release(buffer)
+        self.assertIs(buffers.acquire(50), buffer)
+
+    def test_buffer_over_the_limit_is_not_kept(self):
+        buffers = EventBodyBuffers(max_buffer_bytes=1000)
+        buffer = buffers.acquire(1001)
+        buffers.release(buffer)
+        self.assertIsNot(buffers.acquire(1001), buffer)
+
+    def test_buffers_of_the_typical_size_are_kept(self):
+        buffers = EventBodyBuffers(max_buffers=2)
+        typical = [buffers.acquire(100) for _ in range(2)]
+        large = buffers.acquire(10000)
+        for buffer in typical + [large]:
+            buffers.release(buffer)
+        self.assertEqual(sorted(len(buffer) for buffer in buffers._free_buffers), [100, 100])
+
+    def test_buffers_too_small_for_the_typical_size_go_first(self):
+        buffers = EventBodyBuffers(max_buffers=2)
+        small = buffers.acquire(10)
+        typical = [buffers.acquire(1000) for _ in range(8)]
+        for buffer in [small] + typical[:2]:
+            buffers.release(buffer)
+        self.assertEqual(sorted(len(buffer) for buffer in buffers._free_buffers), [1000, 1000])
+
+
+if __name__ == '__main__':
+    unittest.main()